@@ -1,7 +1,10 @@
 # Generates synthetic input data in front of real input data, to allow for model "spin-up"
 
 import os
-import calendar
+import sys
+import numpy as np
+sys.path.append('..')
+import PRMSio
 
 datadir='input' # directory containing original .data input files
 newdatadir='input_w_synthetic' # where to put new .data files
@@ -10,21 +13,26 @@ timepers=['1961-2000','2046-2065','2081-2100']
 repeatpers=['1961-1961','2046-2046','2081-2081']
 nyearss=[20,40,40]
 
+# 'cyclic': repeat the years in repeatper in order
+# 'resample': copy years drawn at random from repeatper
+# 'detrended': cyclic, with the linear trend over repeatper removed from tmax and tmin (use a repeatper of several years)
+mode='cyclic'
+seed=0 # seed for the random draws in 'resample' mode
+
+allfiles=os.listdir(datadir)
+
 for i in range(len(timepers)):
     timeper=timepers[i] # (str) 'yyyy-yyyy' time period to extend
     repeatper=repeatpers[i] # (str) 'yyyy-yyyy' time period repeat for synthetic data (01-01 to 12-31)
     nyears=nyearss[i] # (int) years of synthetic time to insert before beginning of real input dataset
     
-    
-    # get list of files
-    allfiles=os.listdir(datadir)
     datafiles2edit=[f for f in allfiles if timeper in f and f.endswith('.data')]
     
     # setup time periods
     timeper=map(int,timeper.split('-'))
     newtimeper='%s-%s' %(timeper[0]-nyears,timeper[1])
     repeatper=map(int,repeatper.split('-'))
-    cycles=int(float(nyears)/float(repeatper[1]-repeatper[0]+1))
+    repeat_years=np.arange(repeatper[0],repeatper[1]+1)
     
     print 'Adding synthetic data for %s-%s...' %(timeper[0]-nyears,timeper[0])
     
@@ -33,69 +41,6 @@ for i in range(len(timepers)):
         GCM,scenario,realization,timeper=files.split('.')[0:4]
         newfname='%s.%s.%s.%s.bec_ide.data' %(GCM,scenario,realization,newtimeper)
         
-        data=open(os.path.join(datadir,files)).readlines()
-        data2repeat=[]
-        header=[]
-        
-        for line in data:
-            # find start
-            try:
-                year=int(line.split()[0])
-            except:
-                header.append(line)
-                continue
-            if repeatper[0]<=year<=repeatper[1]:
-                data2repeat.append(line)
-                
-        Leapdaywritten=False
-        syntheticdata=[]
-        for n in range(cycles):
-            
-            for line in data2repeat:
-                splitline=line.split()
-                month,day=map(int,splitline[1:3])
-                newyear=map(int,newtimeper.split('-'))[0]+n
-                Leapyear=calendar.isleap(newyear)
-                if Leapyear:
-                    if month==2 and day==29:
-                        Leapdaywritten=True
-                        newline='%s%s' %(newyear,line[4:])
-                        syntheticdata.append(newline)
-                    if month==3 and day==1:
-                        if not Leapdaywritten: # copy data from March1 to Feb 29
-                            newline='%s  %s  %s  %s' %(newyear,2,29,line[12:])
-                            syntheticdata.append(newline)
-                            newline=newline='%s%s' %(newyear,line[4:])
-                            syntheticdata.append(newline)
-                        else:
-                            newline=newline='%s%s' %(newyear,line[4:])
-                            syntheticdata.append(newline)
-                            # reset flag until 2-29 activates again
-                            Leapdaywritten=False
-                    else:
-                        newline=newline='%s%s' %(newyear,line[4:])
-                        syntheticdata.append(newline)
-                else:
-                    newline='%s%s' %(newyear,line[4:])
-                    syntheticdata.append(newline)
-        
         print '-->\%s' %(os.path.join(newdatadir,newfname))
-        ofp=open(os.path.join(newdatadir,newfname),'w')
-        for line in header:
-            ofp.write(line)
-        for line in syntheticdata:
-            ofp.write(line)
-        for line in data:
-            # find start
-            try:
-                year=int(line.split()[0])
-            except:
-                continue
-            ofp.write(line)
-        ofp.close()
-        
-
-    
-            
-            
-    
\ No newline at end of file
+        data=PRMSio.datafile(os.path.join(datadir,files))
+        data.write_with_spinup(os.path.join(newdatadir,newfname),repeat_years,nyears,mode,seed)
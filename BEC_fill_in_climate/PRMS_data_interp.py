@@ -12,6 +12,8 @@
 
 
 import os
+import time
+import multiprocessing
 import numpy as np
 from matplotlib.backends.backend_pdf import PdfPages
 import PRMS_data_interp_functions
@@ -28,18 +30,29 @@ Int_method='AnnualMean' # 'AnnualMean' or 'DailyMeans' # a more elegant way to d
 Noise=False # add random noise to interpolated daily means; magnitude of noise based on daily standard deviations in tmin,tmax
 use_smoothed=False # use smoothed values for daily standard deviations in temperature
 std_rolling_mean_window=100 # width of moving window (days) for smoothing daily standard deviations via rolling mean
+seed=0 # seed for the random noise; with the GCM-scenario and gap, determines the noise exactly (vary for an ensemble of realizations)
+noise_ar1=0. # lag-1 autocorrelation of the daily noise (0 for independent days)
 
 # instead of random noise, simulate daily variability by copying temp deviations from daily means for periods with data (just like for precip)
 Copy_var=True
 
+processes=4 # number of GCM-scenarios to process at once (1 processes them serially)
+
 datafiles=[f for f in os.listdir(datadir) if f.endswith('.data')]
 GCM_scenarios=np.unique(['.'.join(f.split('.')[0:2]) for f in datafiles if '20c3m' not in f])
 
-# MAIN program
-print 'grouping data by GCM-scenario:\n'
+# 20th century files that have already been parsed (shared by all GCM-scenarios for a GCM)
+_parsed={}
 
-for g in GCM_scenarios[0:1]:
+def _init_worker(parsed):
+    # hand the parsed 20th century files to each worker process once, instead of with every job
+    global _parsed
+    _parsed=parsed
 
+
+def run_GCM_scenario(g):
+    # read, interpolate and write the continuous input for one GCM-scenario; returns the run time
+    t0=time.time()
     print '%s\n' %(g)
     # list files for each GCM-Scenario, including 20th cent
     GCM=g.split('.')[0]
@@ -49,13 +62,15 @@ for g in GCM_scenarios[0:1]:
     files=sorted(files+_20thcent)
     
     print 'reading in original PRMS data files...'
-    data,timepers,starts,ends,Std,Std_sm,Ncolumns,header=PRMS_data_interp_functions.read_PRMS(files,datadir,avg_per,std_rolling_mean_window)
+    data,timepers,starts,ends,Std,Std_sm,Ncolumns,header=PRMS_data_interp_functions.read_PRMS(files,datadir,avg_per,std_rolling_mean_window,_parsed)
     
     print '\ninterpolating data across time gaps using %s from first and last %s years...' %(Int_method,avg_per)
     if use_smoothed:
-        df,Newtimepers,dfm=PRMS_data_interp_functions.interp_PRMS(data,timepers,avg_per,Ncolumns,starts,ends,Std_sm,Noise,Int_method,Copy_var)
+        df,Newtimepers,dfm=PRMS_data_interp_functions.interp_PRMS(data,timepers,avg_per,Ncolumns,starts,ends,Std_sm,Noise,Int_method,Copy_var,
+                                                                  seed,g,noise_ar1)
     else:
-        df,Newtimepers,dfm=PRMS_data_interp_functions.interp_PRMS(data,timepers,avg_per,Ncolumns,starts,ends,Std,Noise,Int_method,Copy_var)
+        df,Newtimepers,dfm=PRMS_data_interp_functions.interp_PRMS(data,timepers,avg_per,Ncolumns,starts,ends,Std,Noise,Int_method,Copy_var,
+                                                                  seed,g,noise_ar1)
     
     # make some quick plots
     outpdf=PdfPages(os.path.join(plotsdir,'%s.pdf' %(g)))
@@ -63,13 +78,35 @@ for g in GCM_scenarios[0:1]:
     print '\nsaving plots to %s.pdf\n' %(g)
     
     # write to PRMS data file
-    fmt='{:.2f}'.format
+    precision=2 # decimal places
     newtimeper='%s-%s' %(Newtimepers[0][0:4],Newtimepers[-1][-4:])
     outfile='%s.%s.1.%s.bec_ide.data' %(GCM,scenario,newtimeper)
-    PRMS_data_interp_functions.writeoutput(df,header,outfile,newfilesdir,fmt)
+    PRMS_data_interp_functions.writeoutput(df,header,outfile,newfilesdir,precision)
+    return g,time.time()-t0
+
 
-print 'Done'
+# MAIN program
+if __name__=='__main__':
+    
+    # parse each 20th century file once, for all of the GCM-scenarios that use it
+    GCMs=np.unique([g.split('.')[0] for g in GCM_scenarios])
+    parsed=dict((f,PRMS_data_interp_functions.read_datafile(datadir,f)) for f in datafiles
+                if '20c3m' in f and f.split('.')[0] in GCMs)
     
+    print 'processing %s GCM-scenarios:\n' %(len(GCM_scenarios))
+    t0=time.time()
+    if processes>1:
+        print 'using %s processes' %(processes)
+        pool=multiprocessing.Pool(processes,initializer=_init_worker,initargs=(parsed,))
+        results=pool.imap_unordered(run_GCM_scenario,GCM_scenarios)
+    else:
+        _init_worker(parsed)
+        results=(run_GCM_scenario(g) for g in GCM_scenarios)
     
+    for g,elapsed in results:
+        print '%s finished in %.1f s' %(g,elapsed)
+    if processes>1:
+        pool.close()
+        pool.join()
     
-    
\ No newline at end of file
+    print 'Done (%.1f s total)' %(time.time()-t0)
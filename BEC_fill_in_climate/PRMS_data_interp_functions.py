@@ -13,6 +13,11 @@ import calendar
 from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.pyplot as plt
 import pdb
+import hashlib
+import sys
+sys.path.append('..')
+import PRMSio
+import climatology
 
 # function to read dates from PRMS files
 parse=lambda x: datetime.datetime.strptime(x,'%Y %m %d %H %M %S')
@@ -78,7 +83,11 @@ def parseheader(header):
     return tmin,tmax,precip
 
 
-def read_PRMS(files,datadir,avg_per,std_rolling_mean_window):
+def read_PRMS(files,datadir,avg_per,std_rolling_mean_window,parsed=None):
+    # parsed: optional dict of read_datafile() results for files that have already been read
+    # (e.g. a 20c3m file shared by several GCM-scenarios)
+    if parsed is None:
+        parsed={}
     
     timepers=sorted([f.split('.')[3] for f in files])
     starts=defaultdict()
@@ -91,20 +100,19 @@ def read_PRMS(files,datadir,avg_per,std_rolling_mean_window):
         print f
         timeper=f.split('.')[3]
         
-        df,timeper,Ncolumns,header=read_datafile(datadir,f)
+        if f in parsed:
+            df,timeper,Ncolumns,header=parsed[f]
+        else:
+            df,timeper,Ncolumns,header=read_datafile(datadir,f)
         
         data[timeper]=df # save data for timeper to dict for later
         # calculate daily means before and after the time gap
         starts,ends=calc_daily_means(df,timeper,timepers,starts,ends,avg_per)
         # calculate daily standard deviations before and after the time gap
-        Std[timeper]=df.groupby([lambda x: x.month,lambda x: x.day]).std()
+        Std[timeper]=climatology.daily_stats(df)[1]
         
-        # smooth standard deviations using rolling mean (moving window)
-        # start by extending daily std values by 1/2 of window size
-        insert,append = 0.5*std_rolling_mean_window,0.5*std_rolling_mean_window-1
-        Std_extended=Std[timeper][-insert:].append(Std[timeper]).append(Std[timeper][0:append])
-        Std_smoothed=pd.rolling_window(Std_extended,std_rolling_mean_window,'boxcar',center='true')
-        Std_sm[timeper]=Std_smoothed[insert:-append]
+        # smooth standard deviations using rolling mean (moving window, wrapping around the end of the year)
+        Std_sm[timeper]=climatology.smooth(Std[timeper],std_rolling_mean_window)
         
     return(data,timepers,starts,ends,Std,Std_sm,Ncolumns,header)
 
@@ -117,30 +125,19 @@ def calc_daily_means(df,timeper,timepers,starts,ends,avg_per):
     beginavg_end=np.datetime64(df.index[0]+pd.DateOffset(years=avg_per))
     
     if timeper in timepers[:-1]: # average the ends
-        daily_means_end=df[endavg_start:df.index[-1]].groupby([lambda x: x.month,lambda x: x.day]).mean()
+        daily_means_end=climatology.daily_stats(df[endavg_start:df.index[-1]],std=False)
         ends[timeper]=daily_means_end
     if timeper in timepers[1:]: # average the starts
-        daily_means_start=df[df.index[0]:beginavg_end].groupby([lambda x: x.month,lambda x: x.day]).mean()
+        daily_means_start=climatology.daily_stats(df[df.index[0]:beginavg_end],std=False)
         starts[timeper]=daily_means_start
     return starts,ends
 
 
 def diff_from_daily_mean(dailymeans,dailyvalues,tstart,tend):
     # first build dataframe of copied daily means, same shape as dailyvalues
-    allmeans=pd.DataFrame()
-    for i in range(tend+1)[tstart:]:
-        datez=pd.date_range(start=datetime.datetime(i,1,1),end=datetime.datetime(i,12,31))
-        if calendar.isleap(i):
-            means366=dailymeans.copy()
-            means366.index=datez
-            allmeans=allmeans.append(means366)
-        else:
-            means365=dailymeans[(1,1):(2,28)].append(dailymeans[(3,1):(21,31)])
-            means365=means365.copy()
-            means365.index=datez
-            allmeans=allmeans.append(means365)
     start=pd.Timestamp(datetime.datetime(tstart,1,1))
     end=pd.Timestamp(datetime.datetime(tend,12,31))
+    allmeans=climatology.expand(dailymeans,pd.date_range(start=start,end=end))
     dailyvalues_trim=dailyvalues[start:end]
     diffs=dailyvalues_trim-allmeans
     
@@ -205,7 +202,88 @@ def apply_variability_from_ends(i,gap,timepers,t0,t1,data,df0,Temp_columns):
     return df0
 
 
-def interp_PRMS(data,timepers,avg_per,Ncolumns,starts,ends,Std,Noise,Int_method,Copy_var):
+def interp_daily_means(t0,t1,var0,var1,yearlims,leapyearlims,startyear,endyear,Int_method):
+    # linearly interpolates daily means and standard deviations (indexed by (month,day)) across a time gap,
+    # for all days and stations at once
+    # t0,var0 are centered on yearlims[0] (before the gap), t1,var1 on yearlims[1] (after the gap);
+    # 2-29s are interpolated between leapyearlims instead
+    # returns DataFrames of daily values from startyear-1-1 to endyear-12-31
+    keys=list(t0.index)
+    v0,var0s=t0.values,var0.loc[keys].values
+    if Int_method=='DailyMeans':
+        v1,var1s=t1.loc[keys].values,var1.loc[keys].values
+    # Option2- interpolate based on change in mean annual temps between the two periods
+    # use annual means for tmin,tmax at each station
+    # (to try to smooth out exaggerated trends in individual days)
+    elif Int_method=='AnnualMean':
+        # daily values after the gap are the daily means before the gap plus the change in annual means at each station
+        v1=v0+(t1.mean()-t0.mean()).values
+        # do the same for the standard dev.
+        var1s=var0s+(var1.mean()-var0.mean()).values
+    
+    # years at either end of the interpolation for each (month,day)
+    y0=np.array([leapyearlims[0] if k==(2,29) else yearlims[0] for k in keys])
+    y1=np.array([leapyearlims[1] if k==(2,29) else yearlims[1] for k in keys])
+    
+    # row of the (month,day) arrays for each day in the gap
+    dates=pd.date_range(start=datetime.datetime(startyear,1,1),end=datetime.datetime(endyear,12,31))
+    rows=climatology.day_rows(t0,dates)
+    years=np.asarray(dates.year)
+    
+    def interp(v0,v1,rows,years):
+        # fraction of the way across the interpolation for each day (days x 1), applied to all stations
+        w=np.clip((years-y0[rows]).astype(float)/(y1[rows]-y0[rows]),0,1)[:,np.newaxis]
+        return v0[rows]+(v1[rows]-v0[rows])*w
+    
+    means=interp(v0,v1,rows,years)
+    stds=interp(var0s,var1s,rows,years)
+    
+    # days that aren't in t0 (e.g. 2-29 when the periods had none) are left as nans
+    means[rows<0]=np.nan
+    stds[rows<0]=np.nan
+    
+    # 2-29 values interpolated onto years that aren't leap years land on 2-28 (as in a DateOffset);
+    # average them with the 2-28 values
+    if (2,29) in keys:
+        leap=keys.index((2,29))
+        feb28=np.where((dates.month==2) & (dates.day==28) & ~dates.is_leap_year &
+                       (years>=y0[leap]) & (years<=y1[leap]))[0]
+        leaprows=np.repeat(leap,len(feb28))
+        means[feb28]=0.5*(means[feb28]+interp(v0,v1,leaprows,years[feb28]))
+        stds[feb28]=0.5*(stds[feb28]+interp(var0s,var1s,leaprows,years[feb28]))
+    
+    df0=pd.DataFrame(means,index=dates,columns=t0.columns)
+    dfv0=pd.DataFrame(stds,index=dates,columns=t0.columns)
+    return df0,dfv0
+
+
+def noise_stream(seed,*names):
+    # returns an independent random number generator for seed and names (e.g. GCM-scenario and gap),
+    # so that the noise for any one GCM-scenario-gap (and seed, e.g. one realization in an ensemble)
+    # can be generated again exactly, independently of the others
+    key=[int(hashlib.md5(str(n).encode('utf-8')).hexdigest()[:8],16) for n in names]
+    try:
+        return np.random.default_rng(np.random.SeedSequence(seed,spawn_key=key))
+    except AttributeError: # numpy < 1.17
+        return np.random.RandomState([seed]+key)
+
+
+def daily_noise(rng,ndays,ar1=0.):
+    # standard normal noise for each day, drawn from rng
+    # ar1: lag-1 autocorrelation between days (0 for independent days);
+    # the AR(1) series is scaled so that it still has unit variance
+    noise=rng.standard_normal(ndays)
+    if ar1:
+        scale=np.sqrt(1-ar1**2)
+        for t in range(1,ndays):
+            noise[t]=ar1*noise[t-1]+scale*noise[t]
+    return noise
+
+
+def interp_PRMS(data,timepers,avg_per,Ncolumns,starts,ends,Std,Noise,Int_method,Copy_var,
+                seed=0,name='',noise_ar1=0.):
+    # seed, name: seed and name (e.g. GCM-scenario) for the random noise stream for each gap (see noise_stream)
+    # noise_ar1: lag-1 autocorrelation of the daily noise (see daily_noise)
     Means=defaultdict()
     for i in range(len(timepers))[1:]:
         t1=starts[timepers[i]]
@@ -220,80 +298,21 @@ def interp_PRMS(data,timepers,avg_per,Ncolumns,starts,ends,Std,Noise,Int_method,
         yearlims=int(startyear-0.5*avg_per),int(endyear+0.5*avg_per)
         leapyearlims=setleapyearlims(yearlims)
         
-        for month,day in t0.index:
-            
-            if (month,day)==(2,29):
-                d0=np.datetime64(datetime.datetime(leapyearlims[0],month,day))
-                d1=np.datetime64(datetime.datetime(leapyearlims[1],month,day))
-            else:
-                d0=np.datetime64(datetime.datetime(yearlims[0],month,day))
-                d1=np.datetime64(datetime.datetime(yearlims[1],month,day))
-                
-            v0s=t0[(month,day):(month,day)]
-            var0s=var0[(month,day):(month,day)]
-            
-            
-            if Int_method=='DailyMeans':
-                v1s=t1[(month,day):(month,day)]
-                var1s=var1[(month,day):(month,day)]
-            # Option2- interpolate based on change in mean annual temps between the two periods
-            # use annual means for tmin,tmax at each station
-            # (to try to smooth out exaggerated trends in individual days)
-            elif Int_method=='AnnualMean':
-                dAnnualMeans=t1.mean()-t0.mean() # annual means for each station
-                # instead calculate daily values after the gap by adding dAnnualMeans to daily means before gap
-                v1s=t0[(month,day):(month,day)]+dAnnualMeans
-                # do the same for the standard dev.
-                dMeanVar=var1.mean()-var0.mean()
-                var1s=var0[(month,day):(month,day)]+dMeanVar
-            
-            # create new dataframe with daily values on either side of gap
-            df=v0s.append(v1s)
-            df.index=[d0,d1]
-            dfv=var0s.append(var1s)
-            dfv.index=[d0,d1]
-            
-            # resample to fill in gap with annual index intervals
-            df=df.resample('AS')
-            df.index=df.index+pd.DateOffset(month=month,day=day)
-            dfv=dfv.resample('AS')
-            dfv.index=df.index
-            
-            # linear interpolation over new index
-            df=df.apply(pd.Series.interpolate)
-            dfv=dfv.apply(pd.Series.interpolate)
-       
-            # combine interpolated days
-            if month==1 and day==1:
-                df0=df
-                dfv0=dfv
-            else:
-                df0=df0.append(df)
-                dfv0=dfv0.append(dfv)
-                
-        # Trim interpolated data to start/end of gap
-        print 'df0 index= %s' %(df0.index)
-        start,end=datetime.datetime(startyear,1,1),datetime.datetime(endyear,12,31)
-        df0=df0.sort()[start:end]
-        dfv0=dfv0.sort()[start:end]
-        print 'df0 index= %s' %(df0.index)
-        # Trim interpolated data to only temps; sort and resample to remove extra 2-28s
+        # interpolate the daily means and standard deviations across the gap
+        df0,dfv0=interp_daily_means(t0,t1,var0,var1,yearlims,leapyearlims,startyear,endyear,Int_method)
+        
+        # Trim interpolated data to only temps
         Temp_columns=Ncolumns['tmax']+Ncolumns['tmin']    
-        df0=df0[df0.columns[0:Temp_columns]].sort().resample('D')
-        print 'df0 index= %s' %(df0.index)
-        dfv0=dfv0[dfv0.columns[0:Temp_columns]].sort().resample('D') # trim standard deviations too
+        df0=df0[df0.columns[0:Temp_columns]]
+        dfv0=dfv0[dfv0.columns[0:Temp_columns]] # trim standard deviations too
 
         # Option 1 for daily variability: calculate random noise for each day using the standard devs. for real data periods
-        rows,cols=np.shape(df0)
-        noise=np.random.randn(rows) # one random value for tmin,tmax for all stations (because they are not independant!)
-        noise=pd.Series(noise,index=df0.index)
-        # function to multily (columnwise) station daily standard deviations by noise
-        func=lambda x: np.asarray(x) * np.asarray(noise)
-        
         if Noise or Copy_var:
             dfm=df0 # make a copy of df0, so daily means can be compared to synthetic data with noise
         if Noise:
-            df0=df0+dfv0.apply(func) # means + stdevs*random
+            # one random value per day for tmin,tmax for all stations (because they are not independant!)
+            noise=daily_noise(noise_stream(seed,name,gap),len(df0),noise_ar1)
+            df0=df0+dfv0.values*noise[:,np.newaxis] # means + stdevs*random
         
         if Copy_var:
         # Option 2 for daily variability: get differences from the daily means before and after the gap
@@ -392,7 +411,8 @@ def make_plots(df,dfm,Std,Std_sm,std_rolling_mean_window,timepers,Ncolumns,outpd
         outpdf.savefig()
     outpdf.close()
 
-def writeoutput(df,header,outfile,newfilesdir,fmt):
+def writeoutput(df,header,outfile,newfilesdir,precision=2):
+    # precision: decimal places for the values (int, or one per column; 0 for integers)
     ofp=open(os.path.join(newfilesdir,outfile),'w')
     
     print '\nwriting output to %s\n' %(outfile)
@@ -401,8 +421,5 @@ def writeoutput(df,header,outfile,newfilesdir,fmt):
     for lines in header[1:]:
         ofp.write(lines+'\n')
     
-    for i in range(len(df)):
-        ofp.write('%s %s %s 0 0 0  ' %(df.index[i].year,df.index[i].month,df.index[i].day))
-        ofp.write(' '.join(map(fmt,list(df[i:i+1].values[0]))))
-        ofp.write('\n')
+    PRMSio.write_prms_text(ofp,df.index,df.values,precision)
     ofp.close()
@@ -0,0 +1,82 @@
+# Daily climatology statistics (day-of-year means and standard deviations) for all stations at once
+# Days are coded by their position in a leap year (0-365, with 2-29 = 59),
+# so that each (month,day) has the same code in every year
+
+import sys
+import numpy as np
+import pandas as pd
+sys.path.append('..')
+from PRMSdates import day_codes # integer (month,day) codes for dates (without the GIS packages that PRMSio needs)
+
+
+def _month_day_index(codes):
+    # (month,day) MultiIndex for codes
+    days=pd.date_range('2000-01-01','2000-12-31')[codes]
+    return pd.MultiIndex.from_arrays([days.month,days.day])
+
+
+def daily_stats(df,std=True):
+    # computes means (and standard deviations) for each day of the year, for all columns of df (days x stations)
+    # same as df.groupby([lambda x: x.month,lambda x: x.day]).mean() (and .std()), ignoring nans
+    # returns DataFrames (days of the year x stations) indexed by (month,day); or just the means if std=False
+    codes=day_codes(df.index)
+    values=np.asarray(df.values,dtype=float)
+
+    # sort the values by day of year, so that each day is one contiguous block for np.add.reduceat
+    order=np.argsort(codes,kind='mergesort')
+    codes,values=codes[order],values[order]
+    present,starts=np.unique(codes,return_index=True)
+
+    valid=~np.isnan(values)
+    counts=np.add.reduceat(valid,starts,axis=0)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        means=np.add.reduceat(np.where(valid,values,0),starts,axis=0)/counts
+    index=_month_day_index(present)
+    means=pd.DataFrame(means,index=index,columns=df.columns)
+    if not std:
+        return means
+
+    # sample standard deviations (ddof=1, as in pandas) from the deviations from the daily means
+    # (nan for days with fewer than 2 values)
+    rows=np.repeat(np.arange(len(present)),np.diff(np.append(starts,len(codes))))
+    deviations=np.where(valid,values-means.values[rows],0)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        stds=np.sqrt(np.add.reduceat(deviations**2,starts,axis=0)/np.where(counts>1,counts-1,np.nan))
+    stds=pd.DataFrame(stds,index=index,columns=df.columns)
+    return means,stds
+
+
+def smooth(stats,window):
+    # moving mean of daily statistics (days of the year x stations) over window days,
+    # as a circular convolution (wrapping around the end of the year)
+    # each day is the mean of the window//2 days before it, and the window-window//2-1 days after it
+    # days with a nan in their window are nan (as with a rolling mean)
+    window=int(window)
+    values=np.asarray(stats.values,dtype=float)
+    n=len(values)
+    before=window//2
+    wrapped=values[(np.arange(-before,n+window-before-1))%n]
+    missing=np.isnan(wrapped)
+    zeros=np.zeros((1,values.shape[1]))
+    sums=np.cumsum(np.vstack([zeros,np.where(missing,0,wrapped)]),axis=0)
+    nans=np.cumsum(np.vstack([zeros,missing]),axis=0)
+    smoothed=(sums[window:]-sums[:-window])/window
+    smoothed[(nans[window:]-nans[:-window])>0]=np.nan
+    return pd.DataFrame(smoothed,index=stats.index,columns=stats.columns)
+
+
+def day_rows(stats,dates):
+    # returns the row of stats (indexed by (month,day)) for each date; -1 for days that aren't in stats
+    codes=pd.Index(np.asarray(stats.index.get_level_values(0))*100+np.asarray(stats.index.get_level_values(1)))
+    dates=pd.DatetimeIndex(dates)
+    return codes.get_indexer(np.asarray(dates.month)*100+np.asarray(dates.day))
+
+
+def expand(stats,dates):
+    # returns a DataFrame of the daily statistics for each date (e.g. daily means to subtract from daily values)
+    # dates on days that aren't in stats (e.g. 2-29 when the statistics came from years without one) are nan
+    dates=pd.DatetimeIndex(dates)
+    rows=day_rows(stats,dates)
+    values=np.asarray(stats.values,dtype=float)[rows]
+    values[rows<0]=np.nan
+    return pd.DataFrame(values,index=dates,columns=stats.columns)
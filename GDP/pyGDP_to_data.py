@@ -7,12 +7,14 @@ which is separated into separate csv files for each Time Period-GCM-Scenario-Var
 Outputs PRMS .data files, one for each GCM-emissions scenario-time period combination
 - .data files have columns of tmax, tmin, and prcp (one column per hru or measurement data, per variable);
 - and one row for each timestep (e.g. day) of simulation
-
-this code is slow and could probably be sped up a lot
 '''
 import os
+import sys
 import numpy as np
+import pandas as pd
 from collections import defaultdict
+sys.path.append('..')
+import PRMSio
 
 csvdir='D:/ATLData/Fox-Wolf/GDP' # directory containing downloaded files from wicci
 datadir='D:/ATLData/Fox-Wolf/data' # directory for converted files
@@ -116,33 +118,22 @@ for combination in combinations.iterkeys():
     
     print('\n...\t'),
     
-    # loop through lines in input files, converting and writing to output, line by line
-    # each new line in output has date, then tmax, tmin, prcp
-    
-    for i in range(len(data[par])):
-        
-        # explode date from first variable and add (times should be the same for all variables)
-        datetime = list(data[par][i])[0].strip('Z') # override UTC 'Zulu time'
-        (year, month, day) = datetime[:10].split('-')
-        (h, m, s) = datetime[11:-1].split(':')
-        newline = map(int, [year, month, day, h, m, s])
-        
-        # add values for each parameter in par_order
-        for par in par_order:
-            
-            line=list(data[par][i])
-            for value in line[1:]:
-                if par == 'prcp':
-                    if value <= 5e-5: # very small values are due to floating point errors
-                        valueIn = "{0:.2f}".format(0)
-                    else:
-                        valueIn = "{0:.2f}".format(value/25.4) # mm/in
-                elif 't' in par:
-                    valueIn = "{0:.2f}".format(value*(9.0/5.0)+32.0) # C to F
-                newline.append(valueIn)
-                
-        newline = '  '.join(map(str, newline)) + '\n'
-        ofp.write(newline)
+    # convert the values for each parameter in par_order to (times x attributes) arrays in PRMS units
+    # each line in output has date, then tmax, tmin, prcp
+    values = []
+    for par in par_order:
+        names = data[par].dtype.names
+        parvalues = np.column_stack([data[par][n] for n in names[1:]]).astype(float)
+        if par == 'prcp':
+            parvalues = np.where(parvalues <= 5e-5, 0, parvalues/25.4) # mm/in; very small values are due to floating point errors
+        elif 't' in par:
+            parvalues = parvalues*(9.0/5.0)+32.0 # C to F
+        values.append(parvalues)
+
+    # dates from first variable (times should be the same for all variables)
+    dates = pd.to_datetime([d.strip('Z') for d in data[par][names[0]]]) # override UTC 'Zulu time'
+
+    PRMSio.write_prms_text(ofp, dates, np.hstack(values), precision=2)
     ofp.close()
     print "saved to {}".format(outfile)
     print "{0:.0f}".format(100*filenum/len(combinations))+"% Done\n"
@@ -0,0 +1,18 @@
+from __future__ import print_function, division
+__author__ = 'aleaf'
+'''
+date helpers shared by PRMSio and the climate gap-filling code;
+only needs numpy and pandas, so that it can be imported without the GIS packages that PRMSio uses
+'''
+
+import numpy as np
+import pandas as pd
+
+
+def day_codes(dates):
+    """Returns integer (month, day) codes (0-365) for a DatetimeIndex (or sequence of dates),
+    as positions in a leap year (2/29 = 59), so that each (month, day) has the same code in every year."""
+    dates = pd.DatetimeIndex(dates)
+    dayofyear = np.asarray(dates.dayofyear) - 1
+    # days after 2/28 in years that aren't leap years shift up one, to skip the 2/29 code
+    return dayofyear + ((dayofyear >= 59) & ~np.asarray(dates.is_leap_year))
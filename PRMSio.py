@@ -1,20 +1,33 @@
+from __future__ import print_function, division
 __author__ = 'aleaf'
 '''
 classes for reading and writing PRMS/GSFLOW input and output
 '''
 
 import os
+import glob
+import shutil
+import hashlib
+import multiprocessing
 import numpy as np
 import pandas as pd
 import datetime as dt
-import calendar
 from collections import OrderedDict
+try:
+    from itertools import izip as zip # python 2; iterate over the netCDF files one at a time (see write_prms_input)
+except ImportError:
+    pass
 import fiona
-from shapely.geometry import shape, Point
+from shapely.geometry import shape
+try:
+    from shapely import contains_xy # shapely >= 2.0
+except ImportError:
+    from shapely.vectorized import contains as contains_xy
 import netCDF4
 import pyproj
+from shapely.ops import transform
 from GISio import get_proj4
-from GISops import project
+from PRMSdates import day_codes # integer (month, day) codes for dates
 
 
 def prms_date(df):
@@ -27,6 +40,285 @@ def prms_date(df):
         df.insert(0, names[-i], date_cols[-i])
 
 
+_powers_of_ten = 10 ** np.arange(19, dtype=np.int64)
+
+
+def _two_prod(a, b):
+    """Returns the product of a and b as the rounded product, and its (exact) rounding error
+    (Dekker's algorithm)."""
+    prod = a * b
+    split = 134217729.0 # 2**27 + 1
+    c = split * a
+    a_hi = c - (c - a)
+    a_lo = a - a_hi
+    c = split * b
+    b_hi = c - (c - b)
+    b_lo = b - b_hi
+    err = ((a_hi * b_hi - prod) + a_hi * b_lo + a_lo * b_hi) + a_lo * b_lo
+    return prod, err
+
+
+def _round_scaled(values, scale):
+    """Rounds positive values * scale to integers the way '%.*f' formatting does,
+    i.e. based on the exact binary value, with exact ties going to the even integer."""
+    rounded = np.floor(values * scale + 0.5)
+
+    # compare values * 2 * scale (computed exactly) with the midpoints on either side of the rounded values
+    prod, err = _two_prod(values, 2 * scale)
+    lower, upper = 2 * rounded - 1, 2 * rounded + 1
+    below = (prod < lower) | ((prod == lower) & (err < 0))
+    above = (prod > upper) | ((prod == upper) & (err > 0))
+    odd = rounded % 2 == 1
+    rounded -= below | ((prod == lower) & (err == 0) & odd)
+    rounded += above | ((prod == upper) & (err == 0) & odd)
+    return rounded
+
+
+def _format_rows(values, precision):
+    """Formats a (rows x columns) block of values as lines of space-delimited text (bytes),
+    with precision[j] decimal places for column j (0 for integers).
+
+    The digits, decimal points and signs are written directly into a preallocated byte buffer,
+    with the position of each field computed from the field lengths, so that the whole block
+    is formatted with a handful of array operations (one per digit place) instead of one
+    string operation per value. Blocks with values that are too large to scale to exact
+    integers (or infinite) are formatted value by value.
+    """
+    nrows, ncols = values.shape
+    precision = np.broadcast_to(np.asarray(precision, dtype=np.int64), (ncols,))
+
+    # values that can't be scaled to exact integers (too large, or infinite) are formatted with '%.*f' instead
+    with np.errstate(invalid='ignore', over='ignore'):
+        exact = np.abs(values) * 10.0 ** precision < 2 ** 53
+    if not np.all(exact):
+        precision = [int(p) for p in precision]
+        return ''.join(' '.join('%.*f' % (p, v) for p, v in zip(precision, row)) + '\n'
+                       for row in values).encode()
+
+    scaled = _round_scaled(np.abs(values), 10.0 ** precision).astype(np.int64)
+    negative = np.signbit(values)
+
+    # length of each field: digits (at least one before the decimal point), decimal point, sign
+    ndigits = np.maximum(np.searchsorted(_powers_of_ten, scaled, side='right'), precision + 1)
+    point = (precision > 0).astype(np.int64)
+    lengths = ndigits + point + negative
+
+    # position after the end of each field, which holds its delimiter (a space, or the newline)
+    ends = np.cumsum(lengths + 1).reshape(nrows, ncols)
+    buf = np.empty(ends[-1, -1], dtype=np.uint8)
+    buf.fill(ord(' '))
+    buf[ends[:, -1] - 1] = ord('\n')
+    ends -= 1
+
+    for k in range(ndigits.max()):
+        write = k < ndigits
+        pos = ends - 1 - k - (point * (k >= precision))
+        buf[pos[write]] = (48 + (scaled // _powers_of_ten[k]) % 10)[write]
+    buf[(ends - 1 - precision)[:, point > 0].ravel()] = ord('.')
+    buf[(ends - lengths)[negative]] = ord('-')
+    return buf.tobytes()
+
+
+def write_prms_text(ofp, dates, values, precision=None, na_value=-999, chunksize=None):
+    """Writes rows of PRMS dates (Y M D 0 0 0, as written by prms_date) and values to ofp.
+
+    Parameters
+    ----------
+    ofp : open file handle (text or binary)
+    dates : DatetimeIndex, or sequence of datetimes (one per row)
+    values : 2-D array (rows x columns)
+    precision : int, or sequence of ints (one per column)
+        Decimal places for the values; 0 writes integers (e.g. transp_on).
+        By default, 0 for integer arrays, and 2 otherwise.
+    na_value : number
+        Value written in place of nans.
+    chunksize : int
+        Number of rows to format and write at a time
+        (by default, about one million values at a time).
+    """
+    dates = pd.DatetimeIndex(dates)
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    if precision is None:
+        precision = 0 if np.issubdtype(values.dtype, np.integer) else 2
+    precision = np.concatenate([np.zeros(6, dtype=np.int64),
+                                np.broadcast_to(np.asarray(precision, dtype=np.int64), (values.shape[1],))])
+    if chunksize is None:
+        chunksize = max(1, 1000000 // (values.shape[1] + 6))
+
+    date_cols = np.zeros((len(dates), 6))
+    date_cols[:, 0] = dates.year
+    date_cols[:, 1] = dates.month
+    date_cols[:, 2] = dates.day
+
+    write = getattr(ofp, 'buffer', ofp).write
+    if hasattr(ofp, 'buffer'):
+        ofp.flush()
+    for i in range(0, len(values), chunksize):
+        block = np.hstack([date_cols[i:i+chunksize], values[i:i+chunksize].astype(float)])
+        block[np.isnan(block)] = na_value
+        write(_format_rows(block, precision))
+
+
+def prms_datetime_index(date_cols):
+    """Builds a DatetimeIndex from an array of the 6 PRMS date columns (Y, M, D, h, m, s),
+    in one step instead of parsing the dates line by line.
+    """
+    date_cols = np.asarray(date_cols).astype(int)
+    dates = pd.to_datetime(pd.DataFrame({'year': date_cols[:, 0],
+                                         'month': date_cols[:, 1],
+                                         'day': date_cols[:, 2],
+                                         'hour': date_cols[:, 3],
+                                         'minute': date_cols[:, 4],
+                                         'second': date_cols[:, 5]}))
+    return pd.DatetimeIndex(dates)
+
+
+def _md5(*items):
+    """Returns an md5 hash of the items (arrays, bytes, or anything with a string representation)."""
+    md5 = hashlib.md5()
+    for item in items:
+        if isinstance(item, np.ndarray):
+            item = np.ascontiguousarray(item).tobytes()
+        elif not isinstance(item, bytes):
+            item = str(item).encode()
+        md5.update(item)
+    return md5.hexdigest()
+
+
+def _replace_file(src, dst):
+    """Renames src to dst, replacing dst if it exists (os.replace is not available in python 2)."""
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def period_means(chunks, freq='M'):
+    """Computes the mean of each column for each period (e.g. freq='M' for months),
+    from an iterator of (dates, values) blocks such as statvarFile.iter_chunks or datafile.iter_chunks,
+    without holding the whole series in memory. Periods that span blocks are combined.
+
+    Returns a DataFrame of period means (periods x columns), indexed by the start of each period.
+    """
+    sums = OrderedDict()
+    counts = OrderedDict()
+    for dates, values in chunks:
+        codes, periods = pd.factorize(dates.to_period(freq))
+        for i, period in enumerate(periods):
+            block = values[codes == i]
+            sums[period] = sums.get(period, 0) + np.nansum(block, axis=0)
+            counts[period] = counts.get(period, 0) + np.sum(~np.isnan(block), axis=0)
+
+    means = [sums[p] / counts[p] for p in sums.keys()]
+    return pd.DataFrame(means, index=pd.PeriodIndex(list(sums.keys())).to_timestamp())
+
+
+class binaryCache:
+
+    def __init__(self, cache_dir='.prms_cache', max_size_mb=2000):
+        """
+        Binary (.npy) copies of parsed PRMS text files (.data, .day),
+        so that repeat reads of the same file can be memory-mapped instead of parsed.
+
+        Attributes
+        ----------
+        cache_dir : str
+            folder for the cached arrays; created if it doesn't exist
+        max_size_mb : float
+            size cap for cache_dir; least recently used entries are evicted when it is exceeded
+
+        Notes
+        -----
+        Entries are keyed on the absolute path of the text file, its modification time and size,
+        and the dtype of the values. Entries for a file that has changed since it was cached
+        are deleted when the file is next read.
+        """
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _path_key(self, f):
+        return hashlib.md5(os.path.abspath(f).encode()).hexdigest()
+
+    def _file_key(self, f):
+        stat = os.stat(f)
+        return '{}_{}_{}'.format(self._path_key(f), int(stat.st_mtime * 1e6), stat.st_size)
+
+    def _key(self, f, dtype):
+        return '{}_{}'.format(self._file_key(f), np.dtype(dtype).name)
+
+    def _entries(self):
+        """Returns a dict of {key: [files]} for everything in the cache."""
+        entries = {}
+        for f in glob.glob(os.path.join(self.cache_dir, '*.npy')):
+            key = os.path.split(f)[1].split('.')[0]
+            entries.setdefault(key, []).append(f)
+        return entries
+
+    def load(self, f, dtype=np.float64):
+        """Returns the dates and values (as a read-only memmap) cached for f,
+        or None if f isn't in the cache (or has changed since it was cached).
+        """
+        key = self._key(f, dtype)
+        datesfile = os.path.join(self.cache_dir, key + '.dates.npy')
+        valuesfile = os.path.join(self.cache_dir, key + '.values.npy')
+        if not (os.path.exists(datesfile) and os.path.exists(valuesfile)):
+            # remove any entries from before f was changed
+            self.invalidate(f, keep=self._file_key(f))
+            return None
+
+        # touch the entry so that eviction removes the least recently used entries first
+        for cachefile in [datesfile, valuesfile]:
+            os.utime(cachefile, None)
+        dates = pd.DatetimeIndex(np.load(datesfile))
+        values = np.load(valuesfile, mmap_mode='r')
+        return dates, values
+
+    def save(self, f, dates, values):
+        """Saves the dates and values parsed from f; then evicts old entries if the cache is over max_size_mb."""
+        key = self._key(f, values.dtype)
+        for suffix, array in [('.values.npy', np.asarray(values)),
+                              ('.dates.npy', np.asarray(dates, dtype='datetime64[ns]'))]:
+            # write to a temporary file first, so that an interrupted write doesn't leave a bad entry
+            cachefile = os.path.join(self.cache_dir, key + suffix)
+            with open(cachefile + '.tmp', 'wb') as dest:
+                np.save(dest, array)
+            _replace_file(cachefile + '.tmp', cachefile)
+        self.evict()
+
+    def invalidate(self, f, keep=None):
+        """Removes all cache entries for file f (except for those with keys starting with keep)."""
+        path_key = self._path_key(f)
+        for key, files in self._entries().items():
+            if key.startswith(path_key) and not (keep is not None and key.startswith(keep)):
+                for cachefile in files:
+                    os.remove(cachefile)
+
+    def evict(self, max_size_mb=None):
+        """Removes the least recently used entries until the cache is no larger than max_size_mb."""
+        if max_size_mb is None:
+            max_size_mb = self.max_size_mb
+        entries = self._entries()
+        sizes = dict([(key, sum([os.path.getsize(f) for f in files])) for key, files in entries.items()])
+        last_used = dict([(key, max([os.path.getmtime(f) for f in files])) for key, files in entries.items()])
+        total = sum(sizes.values())
+        for key in sorted(entries.keys(), key=lambda k: last_used[k]):
+            if total <= max_size_mb * 1e6:
+                break
+            for cachefile in entries[key]:
+                os.remove(cachefile)
+            total -= sizes[key]
+
+    def clear(self):
+        """Removes everything from the cache."""
+        self.evict(max_size_mb=0)
+
+
 class parseFilenames(object):
 
     def __init__(self, filepath):
@@ -39,9 +331,10 @@ class parseFilenames(object):
 
 class datafile:
 
-    def __init__(self, datafile, parse_timeper=None, parse_scenario=None, parse_gcm=None):
+    def __init__(self, datafile, parse_timeper=None, parse_scenario=None, parse_gcm=None, cache=None):
 
         self.f = datafile
+        self.cache = cache # optional binaryCache instance, for reusing values parsed from the file
         self.timeper = None #os.path.split(self.f)[1].split('.')[3]
         self.scenario = None #os.path.split(self.f)[1].split('.')[1]
         self.gcm = None #os.path.split(self.f)[1].split('.')[0]
@@ -53,27 +346,28 @@ class datafile:
                 self.__dict__[attr] = func(datafile)
 
         self.header = []
-        self.Ncolumns = {}
+        self.Ncolumns = OrderedDict() # number of columns for each variable, in the order listed in the header
         self.tmin = 0 # int, number of tmin columns
         self.tmax = 0 # int, number of tmax columns
         self.precip = 0 # int, number of precip columns
 
         # find first line of data; record header information
-        temp = open(self.f).readlines()
-        for line in temp:
-            try:
-                int(line.split()[0])
-                break
-            except:
+        # (stop reading at the first line of data, instead of reading in the whole file)
+        with open(self.f) as src:
+            for line in src:
                 try:
-                    ncols = int(line.strip().split()[1])
-                    var = line.split()[0]
-                    self.Ncolumns[var] = ncols
-                    self.header.append(line.strip())
-                    continue
+                    int(line.split()[0])
+                    break
                 except:
-                    self.header.append(line.strip())
-                    continue
+                    try:
+                        ncols = int(line.strip().split()[1])
+                        var = line.split()[0]
+                        self.Ncolumns[var] = ncols
+                        self.header.append(line.strip())
+                        continue
+                    except:
+                        self.header.append(line.strip())
+                        continue
 
         self.tmin_start = 6 # assumes that the first 6 columns are for the date and time
         self.tmin_stop = 6
@@ -93,22 +387,235 @@ class datafile:
                 if not tmin:
                     self.tmin_start += self.precip
                     self.tmin_stop += self.precip
-        del temp
 
+    def read_values(self, dtype=np.float64):
+        """Reads the data in the file to a DatetimeIndex and a 2-D array of values
+        (one column for each data column after the 6 date columns).
+        If the datafile has a cache, values are memory-mapped from the cache if available,
+        otherwise they are added to the cache after reading.
+        """
+        if self.cache is not None:
+            cached = self.cache.load(self.f, dtype=dtype)
+            if cached is not None:
+                print('\nloading {} from {}...'.format(self.f, self.cache.cache_dir))
+                return cached
 
-    def read2df(self):
         print('\nreading {}...'.format(self.f))
 
-        # function to read dates from PRMS files
-        parse = lambda x: dt.datetime.strptime(x, '%Y %m %d %H %M %S')
+        # read everything (including the dates) into a single array of the same dtype
+        values = pd.read_csv(self.f, sep=r'\s+', header=None, skiprows=len(self.header), dtype=dtype).values
+        dates = prms_datetime_index(values[:, :6])
+        values = values[:, 6:]
+
+        if self.cache is not None:
+            self.cache.save(self.f, dates, values)
+        return dates, values
+
+    def iter_chunks(self, chunksize=3650, dtype=np.float64):
+        """Reads the file in blocks of chunksize lines, so that the whole file doesn't have to be in memory.
+        Yields a DatetimeIndex and a 2-D array of values (one column for each data column after the 6 date columns)
+        for each block.
+        """
+        print('\nreading {} in blocks of {} lines...'.format(self.f, chunksize))
+
+        for chunk in pd.read_csv(self.f, sep=r'\s+', header=None, skiprows=len(self.header), dtype=dtype,
+                                 chunksize=chunksize):
+            values = chunk.values
+            yield prms_datetime_index(values[:, :6]), values[:, 6:]
+
+    def read_blocks(self, dtype=np.float32):
+        """Reads the data in the file to a DatetimeIndex and an OrderedDict of 2-D arrays (days x columns),
+        one for each variable in the header (e.g. tmax, tmin, prcp), using the column counts in Ncolumns.
+        """
+        dates, values = self.read_values(dtype=dtype)
+
+        blocks = OrderedDict()
+        start = 0
+        for var, ncols in self.Ncolumns.items():
+            blocks[var] = values[:, start:start + ncols]
+            start += ncols
+        return dates, blocks
+
+    def write_with_spinup(self, outfile, repeat_years, nyears, mode='cyclic', seed=None,
+                          detrend_variables=('tmax', 'tmin'), precision=2):
+        """Writes a copy of the file to outfile, with nyears of synthetic data in front of the record
+        (e.g. for model spin-up), built from the data for repeat_years (see synthetic_years).
+        The real data are copied as-is.
+
+        detrend_variables : variables (in Ncolumns) that are detrended in 'detrended' mode
+        precision : decimal places written for the synthetic values (see write_prms_text)
+        """
+        dates, values = self.read_values()
+
+        columns = []
+        start = 0
+        for var, ncols in self.Ncolumns.items():
+            if var in detrend_variables:
+                columns += list(range(start, start + ncols))
+            start += ncols
+
+        first_year = dates[0].year
+        years = np.arange(first_year - nyears, first_year)
+        newdates, newvalues = synthetic_years(dates, values, repeat_years, years,
+                                              mode=mode, seed=seed, detrend_columns=columns)
+
+        print('writing {}'.format(outfile))
+        with open(outfile, 'w') as ofp:
+            for line in self.header:
+                ofp.write(line + '\n')
+            write_prms_text(ofp, newdates, newvalues, precision)
+
+            # copy the real data after the header
+            with open(self.f) as src:
+                for i in range(len(self.header)):
+                    src.readline()
+                ofp.flush()
+                shutil.copyfileobj(src, ofp)
+
+    def read2df(self):
 
-        # read file into pandas dataframe (index_col is kludgy but works)
-        df = pd.read_csv(self.f, delim_whitespace=True, dtype=None, header=None, skiprows=len(self.header),
-                              parse_dates=[[0, 1, 2, 3, 4, 5]], date_parser=parse, index_col='0_1_2_3_4_5')
+        dates, values = self.read_values()
 
+        # columns are numbered as in the file (the first data column is 6)
+        df = pd.DataFrame(values, index=dates, columns=np.arange(values.shape[1]) + 6)
+        df.index.name = '0_1_2_3_4_5'
         return df
 
 
+def synthetic_years(dates, values, repeat_years, years, mode='cyclic', seed=None, detrend_columns=None):
+    """Builds synthetic daily values for years (e.g. to put in front of a record for model spin-up)
+    from the values for repeat_years in a record.
+
+    Parameters
+    ----------
+    dates : DatetimeIndex for the record
+    values : 2-D array (days x columns) of values for the record
+    repeat_years : sequence of years in the record to build the synthetic years from
+    years : sequence of years to build
+    mode : str
+        'cyclic': the repeat years are repeated in order
+        'resample': each synthetic year is a copy of a repeat year drawn at random
+        'detrended': cyclic, with the linear trend over the repeat years removed from detrend_columns
+        (leveled to the start of the record; use a repeat period of several years)
+    seed : int
+        seed for the random draws in 'resample' mode
+    detrend_columns : sequence of column numbers (in values) to detrend; all columns by default
+
+    Returns
+    -------
+    DatetimeIndex and 2-D array (days x columns) for the synthetic years.
+    Feb 29ths in leap years are copied from Mar 1st if the repeat year isn't a leap year
+    (Feb 29ths are dropped in synthetic years that aren't leap years).
+    """
+    dates = pd.DatetimeIndex(dates)
+    values = np.asarray(values, dtype=float)
+    repeat_years = np.atleast_1d(repeat_years)
+    years = np.atleast_1d(years)
+
+    if mode in ['cyclic', 'detrended']:
+        source_years = repeat_years[np.arange(len(years)) % len(repeat_years)]
+    elif mode == 'resample':
+        try:
+            rng = np.random.default_rng(seed)
+        except AttributeError: # numpy < 1.17
+            rng = np.random.RandomState(seed)
+        source_years = rng.choice(repeat_years, len(years))
+    else:
+        raise ValueError("mode must be 'cyclic', 'resample' or 'detrended'")
+
+    if mode == 'detrended':
+        if detrend_columns is None:
+            detrend_columns = slice(None)
+        inperiod = np.isin(dates.year, repeat_years)
+        t = np.asarray((dates - dates[0]).days, dtype=float) # days since the start of the record
+        tp = t[inperiod] - t[inperiod].mean()
+        vp = values[inperiod][:, detrend_columns]
+        slope = np.nansum(tp[:, np.newaxis] * (vp - np.nanmean(vp, axis=0)), axis=0) / np.sum(tp**2)
+        values = values.copy()
+        values[:, detrend_columns] -= slope * t[:, np.newaxis]
+
+    # days in the synthetic years, and the year each is copied from
+    newdates = pd.date_range(dt.datetime(years.min(), 1, 1), dt.datetime(years.max(), 12, 31))
+    newdates = newdates[np.isin(newdates.year, years)]
+    source = source_years[pd.Index(years).get_indexer(newdates.year)]
+
+    # row in the record for each synthetic day (same (month, day) in the source year)
+    record = pd.Index(dates.year * 366 + day_codes(dates))
+    codes = day_codes(newdates)
+    rows = record.get_indexer(source * 366 + codes)
+    copy_march1 = (rows < 0) & (codes == 59)
+    rows[copy_march1] = record.get_indexer(source[copy_march1] * 366 + 60)
+    if np.any(rows < 0):
+        raise ValueError('record is missing days in repeat years {}'.format(np.unique(source[rows < 0])))
+
+    return newdates, values[rows]
+
+
+_transformers = {}
+
+
+def get_transformer(src_proj4, dst_proj4):
+    """Returns a function that transforms arrays of x and y coordinates from src_proj4 to dst_proj4.
+    Transformers are cached by (src_proj4, dst_proj4), so that each is only set up once.
+    """
+    key = (src_proj4, dst_proj4)
+    if key not in _transformers:
+        try:
+            _transformers[key] = pyproj.Transformer.from_crs(src_proj4, dst_proj4, always_xy=True).transform
+        except AttributeError: # pyproj < 2.1
+            pr1, pr2 = pyproj.Proj(src_proj4), pyproj.Proj(dst_proj4)
+            _transformers[key] = lambda x, y: pyproj.transform(pr1, pr2, x, y)
+    return _transformers[key]
+
+
+def _bounding_slice(inds):
+    """Returns the smallest slice containing all of the True values in boolean array inds."""
+    true = np.where(inds)[0]
+    if len(true) == 0:
+        return slice(0, 0)
+    return slice(true[0], true[-1] + 1)
+
+
+def _read_ncfile(ncfile, var_col, time_col, xinds, yinds, within, timesteps_per_read=366):
+    """Reads the times and values for var_col in ncfile, for the points within a model extent
+    (see netCDF4dataset.set_extent). Returns an array of times and a 2-D array of values (times x points).
+
+    The values are read in contiguous hyperslabs (the y, x window around the model extent,
+    for about timesteps_per_read timesteps at a time, rounded to the file's chunk size along the time dimension),
+    which is much faster than boolean indexing on chunked/compressed files; the masking is done in memory.
+    """
+    f = netCDF4.Dataset(ncfile)
+    var = f.variables[var_col]
+    times = np.asarray(f.variables[time_col][:], dtype=float)
+
+    # window around the points in the model bounding box, and the points to keep within it
+    yslice, xslice = _bounding_slice(yinds), _bounding_slice(xinds)
+    ykeep, xkeep = yinds[yslice], xinds[xslice]
+
+    # read whole chunks along the time dimension, so that each chunk is only decompressed once
+    chunking = var.chunking()
+    tchunk = chunking[0] if isinstance(chunking, (list, tuple)) else 1 # None for netCDF3 files
+    step = max(1, int(round(timesteps_per_read / float(tchunk)))) * tchunk
+
+    blocks = []
+    for t in range(0, var.shape[0], step):
+        slab = var[t:t + step, yslice, xslice]
+
+        # cull to model bounding box; reshape to 2-D array of times x points
+        slab = slab[:, ykeep][:, :, xkeep]
+        slab = np.reshape(slab, (slab.shape[0], np.sum(xinds) * np.sum(yinds)))
+
+        # cull to actual extent (this excludes masked points in daymet; see set_extent()
+        blocks.append(np.ma.filled(slab[:, within], np.nan))
+    f.close()
+
+    return times, np.concatenate(blocks)
+
+
+def _read_ncfile_star(args):
+    return _read_ncfile(*args)
+
+
 class netCDF4dataset:
     
     def __init__(self, x_col='x', y_col='y', time_col='time',
@@ -153,21 +660,55 @@ class netCDF4dataset:
             
         self.proj4 = proj4
         self.output_proj4 = output_proj4
+        self._cache_file = None # saved results of set_extent(), if it was run with a cache_dir
         self.reproject_output(output_proj4=output_proj4)
         
-    def set_extent(self, ncfile, model_extent, model_extent_buffer=1000, reduce=1):
-
+    def set_extent(self, ncfile, model_extent, model_extent_buffer=1000, reduce=1, cache_dir=None):
+        """
+        Parameters
+        ----------
+        cache_dir : str, optional
+            folder for saving the results (bounding box indices, points within the model extent,
+            and their reprojected coordinates), keyed on the grid coordinates, model extent geometry,
+            buffer, reduce and projections, so that repeat calls with the same inputs can skip the setup.
+        """
         print('setting extent to {}\n\tusing points in {}...'.format(model_extent, ncfile))
         f = netCDF4.Dataset(ncfile)
+
+        # reset results from any previous extent (including its cache file),
+        # so that they aren't reused or overwritten
+        self._cache_file = None
+        self.outputX = np.array([])
+        self.outputY = np.array([])
         
-        # read geometry of model extent; project to coordinate system of netCDF data
+        # read geometry of model extent
         model_proj4 = get_proj4(model_extent)
-        model_extent = shape(fiona.open(model_extent).next()['geometry'])
-        model_extent = project(model_extent, model_proj4, self.proj4)
+        model_extent = shape(next(iter(fiona.open(model_extent)))['geometry'])
+
+        if cache_dir is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            key = _md5(f.variables[self.x_col][:], f.variables[self.y_col][:], model_extent.wkb,
+                       model_extent_buffer, reduce, model_proj4, self.proj4)
+            self._cache_file = os.path.join(cache_dir, 'extent_{}.npz'.format(key))
+            if os.path.exists(self._cache_file):
+                print('\tloading extent from {}'.format(self._cache_file))
+                # read the arrays out of the npz file, and close it (so that it isn't left locked)
+                with np.load(self._cache_file) as cached:
+                    self._xinds, self._yinds = cached['xinds'], cached['yinds']
+                    self._allX, self._allY = cached['allX'], cached['allY']
+                    self._within = cached['within']
+                    self.X, self.Y = cached['X'], cached['Y']
+                f.close()
+                return
+
+        # project model extent to coordinate system of netCDF data
+        if model_proj4 != self.proj4:
+            model_extent = transform(get_transformer(model_proj4, self.proj4), model_extent)
         model_extent_buff = model_extent.buffer(model_extent_buffer)
 
         # get x and y locations
-        X, Y = f.variables[self.x_col], f.variables[self.y_col]
+        X, Y = f.variables[self.x_col][:], f.variables[self.y_col][:]
 
         # build a mask for data; exclude points outside the model bounding box
         xreduce = np.array([False] * len(X))
@@ -185,12 +726,10 @@ class netCDF4dataset:
         var_rs = np.reshape(var[0, yinds, xinds], (len(X[xinds]) * len(Y[yinds])))
 
         bbox_points_xy = np.reshape(np.meshgrid(X[xinds], Y[yinds]), (2, len(X[xinds]) * len(Y[yinds])))
-        bbox_points = [Point(bbox_points_xy[0, i], bbox_points_xy[1, i]) for i in range(np.shape(bbox_points_xy)[1])]
 
         # create boolean index of whether points are in model extent and not masked in dayment
-        within = np.array([p.within(model_extent)
-                           if not var_rs.mask[i]
-                           else False for i, p in enumerate(bbox_points)])
+        # (test all of the points at once, instead of making a shapely Point for each one)
+        within = contains_xy(model_extent, bbox_points_xy[0], bbox_points_xy[1]) & ~np.ma.getmaskarray(var_rs)
 
 
         self._xinds = xinds # indices of points within model bounding box
@@ -200,95 +739,221 @@ class netCDF4dataset:
         self._within = within # boolean array indicating points within model extent
         self.X = bbox_points_xy[0, within]
         self.Y = bbox_points_xy[1, within]
+        f.close()
+
+        if cache_dir is not None:
+            np.savez(self._cache_file, xinds=self._xinds, yinds=self._yinds, allX=self._allX, allY=self._allY,
+                     within=self._within, X=self.X, Y=self.Y)
 
     def get_data(self, ncfiles, var_col,
-                 output_proj4=None, datetime_output=True, fill_leap_years=True):
+                 output_proj4=None, datetime_output=True, fill_leap_years=True, processes=1):
 
         self.datetime_output = datetime_output
         self.fill_leap_years = fill_leap_years
 
-        if not isinstance(ncfiles, list):
-            ncfiles = [ncfiles]
-
         self.reproject_output(output_proj4=output_proj4)
 
-        df = pd.DataFrame(columns=['point', self.x_col, self.y_col, var_col, self.time_col])
-        for ncfile in ncfiles:
-            print(('\r{}'.format(ncfile)), end=' ')
-            f = netCDF4.Dataset(ncfile)
-            var = f.variables[var_col]
-            for i in range(var.shape[0]):
-
-                time = f.variables[self.time_col][i]
-                datetime = pd.to_datetime(time, unit=self.time_units) + self._toffset
-
-                # reshape variable values to 1-D array; cull to extent bbox
-                var_rs = self._get_values(var, i)
+        # read all of the timesteps in each file at once (times x points within the model extent)
+        times, values = [], []
+        for file_times, file_values in self.iter_data(ncfiles, var_col, processes=processes):
+            times.append(file_times)
+            values.append(file_values)
+        times = np.concatenate(times)
+        values = np.concatenate(values)
 
-                # make dataframe of values for the current timestamp
-                dft = self._build_timestamp_dataframe(var_rs, var_col, time)
-                df = df.append(dft)
+        # fill in 12/31 on leap years (while the values are still in a times x points array)
+        if self.fill_leap_years and self.datetime_output:
+            values = self._average_leapyear_lastdays(times, values)
 
-                # check if current timestamp is 12/30 on a leap year
-                if self.fill_leap_years and self.datetime_output \
-                                and calendar.isleap(datetime.year) \
-                                and datetime.month == 12 \
-                                and datetime.day == 30:
-
-                    # make another dataframe for 12/31, which is missing
-                    # for now, simply copy 12/30 (for daymet, 1/1 is in another file)
-                    dft = self._build_timestamp_dataframe(var_rs, var_col, time+1)
-                    df = df.append(dft)
+        df = self._build_dataframe(times, values, var_col)
         self.df = df
-        if self.fill_leap_years:
-            df = self._compute_leapyear_lastdays(df, var_col)
         return df
 
-    def _build_timestamp_dataframe(self, var_rs, var_col, time):
-
-        dft = pd.DataFrame({self.x_col: self.outputX,
-                            self.y_col: self.outputY,
-                            self.time_col: time,
-                            var_col: var_rs})
-
-        if self.datetime_output:
-            dft['time'] = pd.to_datetime(dft.time.values, unit=self.time_units) + self._toffset
-        dft['point'] = list(range(len(dft)))
-        dft.index = pd.MultiIndex.from_product([np.unique(dft.time.values), dft.point.values])
-
-        return dft
-
-    def _get_values(self, var, i):
+    def iter_data(self, ncfiles, var_col, processes=1, pool=None):
+        """Reads the values within the model extent from each file in ncfiles, in time order.
+        Yields an array of times and a 2-D array of values (times x points) for each file,
+        with a copy of 12/30 added for 12/31 on leap years (if fill_leap_years and datetime_output).
 
-        # reshape variable values to 1-D array; cull to extent bbox
-        var_rs = np.reshape(var[i, self._yinds, self._xinds],
-                            (len(self._allX[self._xinds]) * len(self._allY[self._yinds])))
-        # cull to actual extent (this excludes masked points in daymet; see set_extent()
-        return var_rs[self._within].copy()
-
-    def _compute_leapyear_lastdays(self, df, var_col):
-
-        # get leap years in dataframe, as long as they are followed by a Jan 1
-        # those that are the last year will be left as-is (filled by copying Dec 30)
-        leap_years = np.array([y for y in df.time.dt.year.unique() if calendar.isleap(y) and
-                                          y + 1 in list(df.time.dt.year.unique())])
-        next_years = leap_years + 1 # for Jan 1
+        With processes > 1, the files are read in parallel, in batches of one file per process,
+        so that no more than one batch is held in memory at a time. The files are read with pool
+        (a multiprocessing.Pool of processes workers, which is left open, e.g. for other variables) if given;
+        otherwise a pool is made for this call, and shut down when the generator finishes or is closed.
+        """
+        if not isinstance(ncfiles, list):
+            ncfiles = [ncfiles]
 
-        leap_year_inds = (df.time.dt.month == 12) & (df.time.dt.year.isin(list(leap_years)))
-        next_year_inds = (df.time.dt.month == 1) & (df.time.dt.year.isin(list(next_years)))
+        # sort the files by their first timestamp
+        start_times = []
+        for ncfile in ncfiles:
+            f = netCDF4.Dataset(ncfile)
+            start_times.append(f.variables[self.time_col][0])
+            f.close()
+        ncfiles = [ncfiles[i] for i in np.argsort(start_times, kind='mergesort')]
+
+        args = [(ncfile, var_col, self.time_col, self._xinds, self._yinds, self._within) for ncfile in ncfiles]
+        own_pool = None
+        if pool is None and processes > 1:
+            pool = own_pool = multiprocessing.Pool(processes)
+        try:
+            if pool is not None:
+                for i in range(0, len(args), processes):
+                    for ncfile, (times, values) in zip(ncfiles[i:i + processes],
+                                                       pool.map(_read_ncfile_star, args[i:i + processes])):
+                        print(('\r{}'.format(ncfile)), end=' ')
+                        yield self._fill_leap_year(times, values)
+            else:
+                for arg in args:
+                    print(('\r{}'.format(arg[0])), end=' ')
+                    yield self._fill_leap_year(*_read_ncfile(*arg))
+        finally:
+            if own_pool is not None:
+                own_pool.terminate()
+                own_pool.join()
+
+    def _fill_leap_year(self, times, values):
+        """Adds a timestep for 12/31 after each 12/30 in a leap year (which daymet leaves out);
+        for now, simply copy 12/30 (for daymet, 1/1 is in another file)"""
+
+        # check for timestamps that are 12/30 on a leap year
+        if self.fill_leap_years and self.datetime_output:
+            datetimes = pd.DatetimeIndex(pd.to_datetime(times, unit=self.time_units) + self._toffset)
+            dec30 = np.asarray(datetimes.is_leap_year) & (datetimes.month == 12) & (datetimes.day == 30)
+
+            rows = np.repeat(np.arange(len(times)), np.where(dec30, 2, 1))
+            dec31 = np.append(False, rows[1:] == rows[:-1])
+            times = times[rows] + dec31
+            values = values[rows]
+        return times, values
+
+    def _build_dataframe(self, times, values, var_col):
+        """Makes a long-format dataframe (one row for each point at each timestep),
+        indexed by timestep and point number, from an array of values (times x points)."""
+
+        ntimes, npoints = values.shape
+        df = pd.DataFrame({'point': np.tile(np.arange(npoints), ntimes),
+                           self.x_col: np.tile(self.outputX, ntimes),
+                           self.y_col: np.tile(self.outputY, ntimes),
+                           var_col: values.ravel(),
+                           self.time_col: np.repeat(times, npoints)},
+                          columns=['point', self.x_col, self.y_col, var_col, self.time_col])
 
-        # for all leap years in dataframe, average 12/30 and 1/1
-        df.loc[(df.time.dt.day == 31) & leap_year_inds, var_col] = \
-            (df.ix[(df.time.dt.day == 30) & leap_year_inds, var_col].values +
-             df.ix[(df.time.dt.day == 1) & next_year_inds, var_col].values) / 2.0
+        if self.datetime_output:
+            df['time'] = pd.to_datetime(df.time.values, unit=self.time_units) + self._toffset
+        df.index = pd.MultiIndex.from_arrays([df.time.values, df.point.values])
         return df
 
-    def print_stations(self, out_csv='stations.csv',
+    def write_prms_input(self, ncfiles, outfile=None, dotday_files=None, fill_leap_years=True, processes=1,
+                         precision=2):
+        """Writes PRMS input directly from netCDF files, one file (e.g. one year of daymet) at a time,
+        so that memory use doesn't depend on the length of the record.
+
+        Parameters
+        ----------
+        ncfiles : dict
+            lists of netCDF files for each variable, e.g. {'tmin': [...], 'tmax': [...], 'prcp': [...]}
+            (files for each variable must have the same timestamps)
+        outfile : str, optional
+            .data file to write with all of the variables (in the order tmin, tmax, prcp; same as write_to_dotData)
+        dotday_files : dict, optional
+            .day file to write for each variable, e.g. {'tmin': 'tmin.day'}
+        fill_leap_years : bool
+            add 12/31 to leap years, as the average of 12/30 and the next 1/1 (see get_data)
+        processes : int
+            number of processes for reading each variable (see iter_data)
+        precision : int
+            decimal places written for the values (see write_prms_text)
+        """
+        self.datetime_output = True
+        self.fill_leap_years = fill_leap_years
+        if dotday_files is None:
+            dotday_files = {}
+
+        variables = [var for var in ['tmin', 'tmax', 'prcp'] if var in ncfiles]
+        header_names = {'tmin': 'tmin', 'tmax': 'tmax', 'prcp': 'precip'}
+        npoints = len(self.X)
+
+        # open the output files; record the columns (of the values for all variables) for each
+        outputs = []
+        if outfile is not None:
+            print('writing {}'.format(outfile))
+            ofp = open(outfile, 'w')
+            ofp.write('#Data file written by GSFLOW_climate_utils\n')
+            for var in variables:
+                ofp.write('{} {:.0f}\n'.format(header_names[var], npoints))
+            ofp.write('#'*40 + '\n')
+            outputs.append((ofp, slice(None)))
+        for i, var in enumerate(variables):
+            if var in dotday_files:
+                print('writing {}'.format(dotday_files[var]))
+                ofp = open(dotday_files[var], 'w')
+                ofp.write('created by GSFLOW_climate_utils\n{}     {}\n'.format(var, npoints) + 40*'#' + '\n')
+                outputs.append((ofp, slice(i * npoints, (i + 1) * npoints)))
+
+        # read one file for each variable at a time (with one pool of worker processes for all of the variables)
+        pool = multiprocessing.Pool(processes) if processes > 1 else None
+        try:
+            carry_times, carry_values = None, None
+            for blocks in zip(*[self.iter_data(ncfiles[var], var, processes=processes, pool=pool)
+                                for var in variables]):
+                times = blocks[0][0]
+                for var, (var_times, var_values) in zip(variables, blocks):
+                    if not np.array_equal(var_times, times):
+                        raise ValueError('timestamps in {} files do not match those in {} files'.format(var, variables[0]))
+
+                values = np.hstack([var_values for var_times, var_values in blocks])
+                if carry_times is not None:
+                    times = np.append(carry_times, times)
+                    values = np.vstack([carry_values, values])
+                if self.fill_leap_years:
+                    values = self._average_leapyear_lastdays(times, values)
+
+                # hold back the last two timesteps, in case the last is a 12/31 that needs the next 1/1
+                self._write_rows(outputs, times[:-2], values[:-2], precision)
+                carry_times, carry_values = times[-2:], values[-2:]
+            if carry_times is not None:
+                self._write_rows(outputs, carry_times, carry_values, precision)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            for ofp, columns in outputs:
+                ofp.close()
+
+    def _average_leapyear_lastdays(self, times, values):
+        """Sets the values for 12/31 on leap years to the average of 12/30 and the following 1/1,
+        where both are in values (times x points). Years at the end of the record
+        (without a following 1/1) are left as-is (filled by copying 12/30; see _fill_leap_year)."""
+
+        datetimes = pd.DatetimeIndex(pd.to_datetime(times, unit=self.time_units) + self._toffset)
+        month, day = np.asarray(datetimes.month), np.asarray(datetimes.day)
+
+        # rows for 12/31 on leap years, between a 12/30 and a 1/1
+        dec31 = np.where(np.asarray(datetimes.is_leap_year)[1:-1] & (month[1:-1] == 12) & (day[1:-1] == 31) &
+                         (day[:-2] == 30) & (month[2:] == 1) & (day[2:] == 1))[0] + 1
+        values = values.copy()
+        values[dec31] = (values[dec31 - 1] + values[dec31 + 1]) / 2.0
+        return values
+
+    def _write_rows(self, outputs, times, values, precision=2):
+        """Writes rows of PRMS dates and values (times x points) to each output (file handle, columns)."""
+
+        datetimes = pd.to_datetime(times, unit=self.time_units) + self._toffset
+        for ofp, columns in outputs:
+            write_prms_text(ofp, datetimes, values[:, columns], precision)
+
+    def print_stations(self, out_csv='stations.csv', proj4=None,
                        **kwargs):
+        """Writes the output coordinates of the points within the model extent to out_csv;
+        optionally reprojected to proj4."""
+
+        x, y = self.outputX, self.outputY
+        if proj4 is not None:
+            output_proj4 = self.output_proj4 if self.output_proj4 is not None else self.proj4
+            x, y = get_transformer(output_proj4, proj4)(x, y)
 
-        df = pd.DataFrame({'station': np.arange(len(self.outputX)) + 1,
-                           self.x_col: self.outputX,
-                           self.y_col: self.outputY})
+        df = pd.DataFrame({'station': np.arange(len(x)) + 1,
+                           self.x_col: x,
+                           self.y_col: y})
         print('writing station coordinates to {}'.format(out_csv))
         df.to_csv(out_csv, index=False, **kwargs)
 
@@ -296,17 +961,27 @@ class netCDF4dataset:
 
         self.output_proj4 = output_proj4
         if len(self.outputX) == 0 and output_proj4 is not None:
+
+            # reuse reprojected coordinates saved for the same extent and output projection
+            cache_file = None
+            if self._cache_file is not None and len(self.X) > 0:
+                cache_file = '{}_{}.npz'.format(self._cache_file[:-4], _md5(output_proj4))
+                if os.path.exists(cache_file):
+                    with np.load(cache_file) as cached:
+                        self.outputX, self.outputY = cached['outputX'], cached['outputY']
+                    return
+
             print('reprojecting output coordinates to:\n{}\n'.format(output_proj4))
-            pr1 = pyproj.Proj(self.proj4)
-            pr2 = pyproj.Proj(self.output_proj4)
-            self.outputX, self.outputY = pyproj.transform(pr1, pr2, self.X, self.Y)
+            self.outputX, self.outputY = get_transformer(self.proj4, self.output_proj4)(self.X, self.Y)
+            if cache_file is not None:
+                np.savez(cache_file, outputX=self.outputX, outputY=self.outputY)
         elif output_proj4 is None:
             self.outputX, self.outputY = self.X, self.Y
         else:
             pass
 
 
-    def write_to_dotData(self, df, outfile='climate.data'):
+    def write_to_dotData(self, df, outfile='climate.data', precision=2):
 
         print('writing {}'.format(outfile))
         df['point2'] = df.point + df.point.max() + 1
@@ -318,44 +993,95 @@ class netCDF4dataset:
             data = data.join(pivot)
 
         data.sort_index(axis=1, inplace=True)
-        prms_date(data)
 
         f = open(outfile, 'w')
         npoints = len(np.unique(df.point))
         f.write('#Data file written by GSFLOW_climate_utils\n')
         f.write('tmin {0:.0f}\ntmax {0:.0f}\nprecip {0:.0f}\n'.format(npoints))
         f.write('#'*40 + '\n')
-        data.to_csv(f, sep=' ', header=None, index=False)
+        write_prms_text(f, pd.DatetimeIndex(data.index), data.values, precision)
+        f.close()
 
 
 class statvarFile(parseFilenames):
 
-    def read2df(self):
-        print('\nreading {}...'.format(self.f))
+    def _read_header(self, src):
+        """Reads the header from open statvar file src, leaving src at the first line of data."""
 
         # get header information
-        self.nstats = int(open(self.f).readline())
+        first_line = src.readline()
+        self.nstats = int(first_line)
 
         # strip off the end of lines, then strip trailing '1's on basin variables; attach any segment numbers to names
-        self.statnames = [n.strip() for n in open(self.f).readlines()[:1+self.nstats]]
+        self.statnames = [first_line.strip()] + [src.readline().strip() for i in range(self.nstats)]
         self.statnames = [n.strip(' 1') if n.endswith(' 1') else n.replace(' ', '_') for n in self.statnames]
 
-        # function to read dates from PRMS files
-        parse = lambda x: dt.datetime.strptime(x, '%Y %m %d %H %M %S')
+    def _get_columns(self, usecols=None):
+        """Returns the statvar names to read, the file columns to read (dates and values),
+        and the positions of the values in the array returned by read_csv (in the order of names)."""
 
-        # read file into pandas dataframe (index_col is kludgy but works)
-        df = pd.read_csv(self.f, delim_whitespace=True, header=None, skiprows=self.nstats + 1, parse_dates=[[1, 2, 3, 4, 5, 6]],
-                         date_parser=parse, index_col=0)
-        df.index.name = 'Datetime'
+        names = self.statnames[1:]
+        if usecols is None:
+            usecols = names
+        missing = [n for n in usecols if n not in names]
+        if len(missing) > 0:
+            raise ValueError('{} not found in {}'.format(missing, self.f))
+
+        # the first column contains consecutive integers, the next 6 are the date
+        columns = [names.index(n) + 7 for n in usecols]
+
+        # read_csv returns the columns in file order; map them back to the requested order
+        file_order = sorted(set(columns))
+        positions = [6 + file_order.index(c) for c in columns]
+        return usecols, list(range(1, 7)) + file_order, positions
+
+    def read2df(self, usecols=None):
+        """Reads the statvar file into a DataFrame, with a column for each statvar, indexed by date.
+        The file is read once: the header is parsed from the start of the file,
+        and the rest is read in bulk from the same file handle.
+
+        Parameters
+        ----------
+        usecols : list of str, optional
+            statvar names (as they appear in the DataFrame columns) to read; by default all are read.
+        """
+        print('\nreading {}...'.format(self.f))
 
-         # name the columns using the list of variables in the file header
-        df.columns = self.statnames
+        with open(self.f) as src:
+            self._read_header(src)
+            usecols, columns, positions = self._get_columns(usecols)
 
-        # drop the first column, which just contains consecutive integers and has nstatvar as its label
-        df = df.drop(str(self.nstats), axis=1)
+            # read the rest of the file into a single array
+            data = pd.read_csv(src, sep=r'\s+', header=None, usecols=columns,
+                               dtype=np.float64, float_precision='round_trip').values
 
+        df = pd.DataFrame(data[:, positions], index=prms_datetime_index(data[:, :6]), columns=usecols)
+        df.index.name = 'Datetime'
         return df
 
+    def iter_chunks(self, chunksize=3650, usecols=None):
+        """Reads the statvar file in blocks of chunksize lines, so that the whole file doesn't have to be in memory.
+        Yields a DatetimeIndex and a 2-D array of values (dates x statvars) for each block;
+        the statvar names for the array columns are in the chunk_columns attribute.
+
+        Parameters
+        ----------
+        chunksize : int
+            number of lines (timesteps) in each block
+        usecols : list of str, optional
+            statvar names to read; by default all are read.
+        """
+        print('\nreading {} in blocks of {} lines...'.format(self.f, chunksize))
+
+        with open(self.f) as src:
+            self._read_header(src)
+            self.chunk_columns, columns, positions = self._get_columns(usecols)
+
+            for chunk in pd.read_csv(src, sep=r'\s+', header=None, usecols=columns,
+                                     dtype=np.float64, float_precision='round_trip', chunksize=chunksize):
+                data = chunk.values
+                yield prms_datetime_index(data[:, :6]), data[:, positions]
+
 
 class dotDay:
 
@@ -365,46 +1091,28 @@ class dotDay:
         self.nhru = np.shape(df)[1]
 
     def transp(self, last_frost, first_frost, nhru):
-
+        """Builds an int8 (n days x nhru) DataFrame of transpiration (1) and no transpiration (0)
+        from (n years x nhru) DataFrames of last and first frosts (day numbers within the year);
+        transpiration is on for the days between the last and first frosts.
+        """
         self.df_lf = last_frost
         self.df_ff = first_frost
         self.index = pd.date_range(dt.datetime(last_frost.index[0], 1, 1),
                                    dt.datetime(last_frost.index[-1], 12, 31))
+        self.index = self.index[np.isin(self.index.year, last_frost.index.values)]
         self.columns = np.arange(nhru) + 1
         self.header = []
 
-        # convert frost dates to boolean series (loop seems clunky but not sure how to vectorize this)
         print('\n\nconverting growing season dates to boolean dataframe...')
-        for year in self.df_lf.index:
-            print(year, end=' ')
-            l = [self.toBoolean(year, h) for h in (np.arange(nhru) + 1)] # using a list comprehension is MUCH faster than another loop
-            transp_yr = pd.DataFrame(l).T # make a DataFrame for the year
-            self.df = self.df.append(transp_yr)
-
-
-    def toBoolean(self, year, hru):
-        '''
-        takes a year, last and first frost date,
-        and returns a daily series of zeros (no transpiration), and ones (transpiration)
-        '''
-        last_frost, first_frost = self.df_lf.ix[year, hru], self.df_ff.ix[year, hru]
-
-        # make datetime64 objects for start/end of year and growing season
-        Jan1, Dec31 = pd.Timestamp(dt.datetime(year, 1, 1)), pd.Timestamp(dt.datetime(year, 12, 31))
-        last_frost_date, first_frost_date = Jan1 + np.timedelta64(last_frost, 'D'), Jan1 + np.timedelta64(first_frost, 'D')
-
-        # make index for each period
-        lateWinter = pd.date_range(start=Jan1, end=last_frost_date)
-        summer = pd.date_range(start=last_frost_date, end=first_frost_date)[1:-1] # pandas includes end dates in slice
-        earlyWinter = pd.date_range(start=first_frost_date, end=Dec31)
-
-        # put them together into a boolean series (n days x 1 hru)
-        days = pd.Series(data=0, index=lateWinter)
-        days = days.append(pd.Series(data=1, index=summer))
-        days = days.append(pd.Series(data=0, index=earlyWinter))
-
-        return days
+        # broadcast the frosts for each year to its days, and compare with the days since Jan 1
+        year = np.searchsorted(last_frost.index.values, self.index.year)
+        day = (self.index.dayofyear.values - 1)[:, np.newaxis]
+        lf = last_frost.values.astype(int)[year, :nhru]
+        ff = first_frost.values.astype(int)[year, :nhru]
+        transp_on = ((day > lf) & (day < ff)).astype(np.int8)
 
+        self.df = pd.DataFrame(transp_on, index=self.index, columns=self.columns)
+        self.nhru = nhru
 
     def write_output(self, outfile):
 
@@ -414,17 +1122,8 @@ class dotDay:
         for lines in self.header:
             ofp.write(lines)
 
-        # insert columns for PRMS date
-        ndays = len(self.df)
-        date_cols = [self.df.index.year,
-                     self.df.index.month,
-                     self.df.index.day,
-                     0, 0, 0]
-        names = ['Y', 'M', 'D', 'h', 'm', 's']
-        for i in np.arange(6)+1:
-            self.df.insert(0, names[-i], date_cols[-i])
-        # add dataframe to output file
-        self.df.to_csv(ofp, sep=' ', header=False, index=False, float_format='%.2f')
+        # add dates and values to output file (integer values, e.g. transp_on, are written as integers)
+        write_prms_text(ofp, self.df.index, self.df.values)
 
         ofp.close()
 
@@ -1,7 +1,9 @@
 # programs for aggregating and plotting results from GSFLOW climate change scenario runs
 
 import os
+import io
 import zipfile
+import multiprocessing
 import numpy as np
 import pandas as pd
 import datetime as dt
@@ -9,10 +11,11 @@ import matplotlib.pyplot as plt
 from matplotlib.patches import Polygon
 import matplotlib.dates as mdates
 import matplotlib.cm as cm
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import textwrap
 import calendar
 import pdb
+from climate_stats import read_aggregated
 
 def check4output_folder(mode):
     dirs=[f for f in os.listdir(os.getcwd()) if os.path.isdir(f)]
@@ -96,16 +99,31 @@ def getvars(results_folder,mode):
     return varlist
 
 
-def getscenarios(results_folder):
+def _zip_scenario(path):
+    zfile=zipfile.ZipFile(path)
+    statvarfile=[f.filename for f in zfile.infolist() if 'statvar' in f.filename][0]
+    zfile.close()
+    return statvarfile.split(os.sep)[1].split('.')[1]
+
+
+def getscenarios(results_folder,processes=1):
+    # processes: number of worker processes for reading the zip files (1 reads them serially)
     fromZip=False
     allfiles=os.listdir(results_folder)
-    zipfiles=[f for f in allfiles if f.endswith('.zip')]
+    zipfiles=[os.path.join(results_folder,f) for f in allfiles if f.endswith('.zip')]
     
+    if processes>1:
+        pool=multiprocessing.Pool(processes)
+        try:
+            zip_scenarios=pool.map(_zip_scenario,zipfiles)
+        finally: # shut down the workers even if a zip file can't be read
+            pool.terminate()
+            pool.join()
+    else:
+        zip_scenarios=list(map(_zip_scenario,zipfiles))
+
     scenarios=[]
-    for z in zipfiles:
-        zfile=zipfile.ZipFile(os.path.join(results_folder,z))
-        statvarfile=[f.filename for f in zfile.infolist() if 'statvar' in f.filename][0]
-        scenario=statvarfile.split(os.sep)[1].split('.')[1]
+    for scenario in zip_scenarios:
         if scenario not in scenarios:
             scenarios.append(scenario)
     return(scenarios)
@@ -114,7 +132,8 @@ def getscenarios(results_folder):
 def save_aggregated(var,aggregated_results_folder,GCMs,var_values,uzf_gage,**kwargs):
     # aggregated_results_folder: location to save aggregated files
     # GCMs: list of GCMs included in results. 
-    # var_values: multi-level dict organized by [scenario][date][GCM]
+    # var_values: dict of (dates, values) organized by [scenario] (or [scenario][timeper] if separate);
+    # see build_var_values()
     # uzf_gage: True or False
     
     try:
@@ -124,7 +143,7 @@ def save_aggregated(var,aggregated_results_folder,GCMs,var_values,uzf_gage,**kwa
         pass    
     
     # Function to write stuff out
-    def write2output(outfile,GCMs,var_values,scenario):
+    def write2output(outfile,GCMs,dates,values):
         print(' -> saving to %s' %(outfile))
         ofp=open(outfile,'w')
         ofp.write('Date')
@@ -134,20 +153,15 @@ def save_aggregated(var,aggregated_results_folder,GCMs,var_values,uzf_gage,**kwa
             ofp.write(',%s' %(GCM))
         ofp.write('\n')
     
-        # write data, enforcing same column for each GCM
-        if separate:
-            timper=outfile.split('.')[-2]
-            valuesdict=var_values[scenario][timper]
-        else:
-            valuesdict=var_values[scenario]
-            
-        for date in sorted(valuesdict.keys()):
-            ofp.write(str(date))
-            for GCM in GCMs:
-                try:
-                    ofp.write(',%s' %(valuesdict[date][GCM][0]))
-                except IndexError:
+        # write data; columns in values are already in the same order as GCMs
+        datestrings=np.datetime_as_string(dates.astype('datetime64[s]'))
+        for date,row in zip(datestrings,values.tolist()):
+            ofp.write(date.replace('T',' '))
+            for value in row:
+                if np.isnan(value):
                     ofp.write(',NaN')
+                else:
+                    ofp.write(',%s' %(value))
             ofp.write('\n')
         ofp.close()    
 
@@ -155,17 +169,87 @@ def save_aggregated(var,aggregated_results_folder,GCMs,var_values,uzf_gage,**kwa
     if uzf_gage:
         var=var+'-uzfgage'
         
-    #var_values[scenario][timeper][date][GCM]
+    #var_values[scenario][timeper]
     for scenario in var_values.keys():
         if separate:
             for timeper in var_values[scenario].keys():
                 outfile=os.path.join(aggregated_results_folder,'%s.%s.%s.csv' %(var,scenario,timeper))
                 
-                write2output(outfile,GCMs,var_values,scenario)
+                write2output(outfile,GCMs,*var_values[scenario][timeper])
         else:
             outfile=os.path.join(aggregated_results_folder,'%s.%s.csv' %(var,scenario)) 
         
-            write2output(outfile,GCMs,var_values,scenario)
+            write2output(outfile,GCMs,*var_values[scenario])
+
+
+def build_var_values(var_runs,GCMs,spinup,**kwargs):
+    # var_runs: list of (GCM,scenario,timeper,dates,values) for one variable,
+    # with dates and values as datetime64 and float arrays of equal length
+    # GCMs: list of GCMs included in results (sets the column order)
+    # returns overall_max,overall_min,var_values
+    # var_values: dict of (dates, values) for each scenario (for each scenario and timeper if separate)
+    # dates: sorted datetime64 index shared by all of the GCMs
+    # values: float64 array (dates x GCMs), with NaNs where a GCM has no value
+
+    try:
+        separate=kwargs['separate']
+    except KeyError:
+        separate=False
+
+    # group the runs by scenario (or scenario and timeper), in the order that they were read
+    groups=OrderedDict()
+    for run in var_runs:
+        GCM,scenario,timeper=run[:3]
+        key=(scenario,timeper) if separate else scenario
+        groups.setdefault(key,[]).append(run)
+
+    var_values=OrderedDict()
+    overall_max=0
+    overall_min=0
+    for key,group in groups.items():
+        dates=np.unique(np.concatenate([run[3] for run in group]))
+        values=np.empty((len(dates),len(GCMs)))
+        values.fill(np.nan)
+
+        for GCM,scenario,timeper,rdates,rvalues in group:
+            ts=np.datetime64('%s-01-01' %(int(timeper.split('-')[0])+spinup))
+
+            # if spinup period has ended, record
+            # (only the first value for a date-GCM is kept)
+            recorded=rdates>=ts
+            rows,first=np.unique(np.searchsorted(dates,rdates[recorded]),return_index=True)
+            rvalues=rvalues[recorded][first]
+            column=values[:,GCMs.index(GCM)]
+            empty=np.isnan(column[rows])
+            column[rows[empty]]=rvalues[empty]
+
+            # if overall max/min encountered, record
+            rvalues=rvalues[~np.isnan(rvalues)]
+            if len(rvalues)>0:
+                overall_max=max(overall_max,rvalues.max())
+                overall_min=min(overall_min,rvalues.min())
+
+        if separate:
+            var_values.setdefault(key[0],OrderedDict())[key[1]]=(dates,values)
+        else:
+            var_values[key]=(dates,values)
+    return(overall_max,overall_min,var_values)
+
+
+def aggregated_dataframes(var_values,GCMs):
+    # makes a DataFrame for each scenario (or scenario.timeper) from the output of build_var_values()
+    # with the same layout as the saved csv files (Date index, one column per GCM);
+    # these can be supplied instead of csv files to the functions in climate_stats
+    dfs=OrderedDict()
+    for scenario in var_values.keys():
+        if isinstance(var_values[scenario],tuple):
+            items=[(scenario,var_values[scenario])]
+        else:
+            items=[('%s.%s' %(scenario,timeper),v) for timeper,v in var_values[scenario].items()]
+        for name,(dates,values) in items:
+            df=pd.DataFrame(values,index=pd.DatetimeIndex(dates,name='Date'),columns=GCMs)
+            dfs[name]=df
+    return dfs
 
 
 def aggregate(var,varlist,results_folder,mode,spinup,**kwargs):
@@ -187,12 +271,7 @@ def aggregate(var,varlist,results_folder,mode,spinup,**kwargs):
     allfiles=os.listdir(results_folder)
     zipfiles=[f for f in allfiles if f.endswith('.zip')]    
     
-    var_values=defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-    if separate:
-        var_values=defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(list))))
-        
-    overall_max=0
-    overall_min=0
+    var_runs=[]
     GCMs=[]
     uzf_gage=False
     for z in zipfiles:
@@ -237,9 +316,16 @@ def aggregate(var,varlist,results_folder,mode,spinup,**kwargs):
             var_inds=var_inds+1
             
         # read in data from variable file
-        varfile=zfile.open(varfile).readlines()
+        varfile=_readlines(zfile,varfile)
+        if mode in ['statvar','csv']:
+            # parse dates and values in bulk; other modes are read line by line below
+            dates,values=read_columns(varfile[startrow:],mode,var_inds,1)
+            zfile.close()
+            var_runs.append((GCM,scenario,timeper,dates,values[:,0]))
+            continue
+
         t0=dt.datetime(int(timeper.split('-')[0]),1,1)
-        ts=dt.datetime(int(timeper.split('-')[0])+spinup,1,1,0,0)
+        dates,values=[],[]
         columns=0
         for line in varfile[startrow:]:
             splitline=line.strip().split(delim)
@@ -252,12 +338,7 @@ def aggregate(var,varlist,results_folder,mode,spinup,**kwargs):
             if len(splitline)<columns:
                 break
             
-            if mode=='statvar':
-                # working in datetime ensures proper sorting
-                date=dt.datetime.strptime(' '.join(splitline[1:4]),'%Y %m %d') 
-            elif mode=='csv':
-                date=dt.datetime.strptime(splitline[0],'%m/%d/%Y')
-            elif mode=='ggo':
+            if mode=='ggo':
                 if len(splitline)==0:
                     uzf_gage=True # UZF gages have empty 3rd line
                     continue
@@ -273,25 +354,254 @@ def aggregate(var,varlist,results_folder,mode,spinup,**kwargs):
             elif mode=='uzf':
                 date=t0+dt.timedelta(float(splitline[0])-1)
 
-            value=float(splitline[var_inds])
-            
-            if separate:
-                valuesdict=var_values[scenario][timeper][date][GCM]
-            else:
-                valuesdict=var_values[scenario][date][GCM]
-            
-            if date>=ts: # if spinup period has ended, record
-                valuesdict.append(value)
-            else:
-                continue
-            # if overall max/min encountered, record
-            if value> overall_max:
-                overall_max=value
-            if value< overall_min:
-                overall_min=value
+            dates.append(date)
+            values.append(float(splitline[var_inds]))
+        zfile.close()
+        var_runs.append((GCM,scenario,timeper,np.array(dates,dtype='datetime64[s]'),np.array(values,dtype=float)))
+
+    # assemble runs into arrays of values (dates x GCMs) for each scenario
+    overall_max,overall_min,var_values=build_var_values(var_runs,GCMs,spinup,separate=separate)
     return(overall_max,overall_min,GCMs,var_values,uzf_gage)
 
 
+def _readlines(zfile, name):
+    # read a file in a zip archive as a list of text lines
+    lines=zfile.open(name).readlines()
+    return [l.decode() if isinstance(l, bytes) else l for l in lines]
+
+
+def _datetime64(years,months,days):
+    # converts integer arrays of years, months and days to datetime64 (in one step, instead of strptime by line)
+    months=(np.asarray(years,dtype=int)-1970)*12+np.asarray(months,dtype=int)-1
+    dates=months.astype('datetime64[M]').astype('datetime64[D]')+(np.asarray(days,dtype=int)-1)
+    return dates.astype('datetime64[s]')
+
+
+def read_columns(lines,mode,offset,nvalues):
+    # bulk-parses the lines of a statvar or csv file into dates and values
+    # lines: lines of the file, starting with the first line of data
+    # mode: 'statvar' or 'csv'
+    # offset: column of the first value to read
+    # nvalues: number of value columns to read
+    # returns dates (datetime64 array) and values (float array of shape (dates x nvalues))
+
+    delim=',' if mode=='csv' else None
+
+    # if columns are missing at some point, file probably incomplete
+    # (due to model run failure); stop reading
+    ncolumns=np.array([len(line.strip().split(delim)) for line in lines],dtype=int)
+    truncated=np.where(ncolumns<np.maximum.accumulate(ncolumns))[0] if len(lines)>0 else []
+    nlines=truncated[0] if len(truncated)>0 else len(lines)
+    if nlines==0:
+        return np.array([],dtype='datetime64[s]'),np.empty((0,nvalues))
+
+    # read the numbers in bulk; round_trip gives the same floats as float() on each value
+    text=io.StringIO(''.join(lines[:nlines]))
+    names=list(range(ncolumns[:nlines].max()))
+    if mode=='statvar':
+        data=pd.read_csv(text,sep=r'\s+',header=None,names=names,float_precision='round_trip')
+        dates=_datetime64(data[1].values,data[2].values,data[3].values)
+    elif mode=='csv':
+        data=pd.read_csv(text,header=None,names=names,float_precision='round_trip')
+        mdy=np.array([d.split('/') for d in data[0].values],dtype=int)
+        dates=_datetime64(mdy[:,2],mdy[:,0],mdy[:,1])
+    values=data.values[:,offset:offset+nvalues].astype(float)
+    return dates,values
+
+
+def read_run(path,varlist,mode):
+    # parses every variable in varlist from a single zipped run, opening each output file only once
+    # path: zip file of results for one GCM-scenario-realization-timeper
+    # varlist: list of all vars being aggregated for specified mode
+    # mode: 'statvar','csv','ggo','ssf','uzf'
+    # returns GCM,scenario,timeper,columns,uzf_gages
+    # columns: dict of (dates, values) for each var (datetime64 and float arrays of equal length)
+    # uzf_gages: dict of True/False for each var (only applies to ggo mode)
+
+    zfile=zipfile.ZipFile(path)
+    statvarfile=[f for f in zfile.namelist() if 'statvar' in f][0]
+
+    # map results to GCM,scenario,realization,timeper, using statvar name
+    GCM,scenario,realization,timeper=os.path.split(statvarfile)[-1].split('.')[:4]
+    t0=dt.datetime(int(timeper.split('-')[0]),1,1)
+
+    columns={}
+    uzf_gages=dict([(var,False) for var in varlist])
+
+    if mode=='ggo':
+        # one file per gage; values are always in the 3rd column
+        for var in varlist:
+            dates,values=[],[]
+            ncolumns=0
+            for line in _readlines(zfile,var+'.ggo')[2:]:
+                splitline=line.strip().split()
+                if len(splitline)>ncolumns:
+                    ncolumns=len(splitline)
+                if len(splitline)<ncolumns:
+                    break
+                if len(splitline)==0:
+                    uzf_gages[var]=True # UZF gages have empty 3rd line
+                    continue
+                if uzf_gages[var]:
+                    dates.append(t0+dt.timedelta(float(splitline[1])-1))
+                else:
+                    dates.append(t0+dt.timedelta(float(splitline[0])-1))
+                values.append(float(splitline[2]))
+            columns[var]=(np.array(dates,dtype='datetime64[s]'),np.array(values,dtype=float))
+
+    elif mode=='ssf':
+        # all variables are stacked in one file; first column identifies the variable
+        columns=dict([(var,([],[])) for var in varlist])
+        varfile=[f for f in zfile.namelist() if 'ssf' in f][0]
+        ncolumns=0
+        for line in _readlines(zfile,varfile):
+            splitline=line.strip().split()
+            if len(splitline)>ncolumns:
+                ncolumns=len(splitline)
+            if len(splitline)<ncolumns:
+                break
+            if splitline[0] not in columns:
+                continue
+            dates,values=columns[splitline[0]]
+            dates.append(dt.datetime.strptime(splitline[1],'%m/%d/%Y')-dt.timedelta(1))
+            values.append(float(splitline[3]))
+        for var in varlist:
+            dates,values=columns[var]
+            columns[var]=(np.array(dates,dtype='datetime64[s]'),np.array(values,dtype=float))
+
+    else:
+        # one column per variable, all sharing the same dates
+        delim=None # default whitespace setting
+        if mode=='statvar':
+            varfile=statvarfile
+            startrow=len(varlist)+1
+            offset=7
+        elif mode=='csv':
+            varfile=[f for f in zfile.namelist() if '.csv' in f][0]
+            startrow=1
+            delim=','
+            offset=1
+        elif mode.lower()=='uzf':
+            varfile=[f for f in zfile.namelist() if 'uzf' in f.lower()][0]
+            startrow=3
+            offset=1
+
+        lines=_readlines(zfile,varfile)[startrow:]
+        if mode in ['statvar','csv']:
+            dates,values=read_columns(lines,mode,offset,len(varlist))
+        else:
+            dates,rows=[],[]
+            ncolumns=0
+            for line in lines:
+                splitline=line.strip().split(delim)
+
+                # if columns are missing at some point, file probably incomplete
+                # (due to model run failure); stop reading
+                if len(splitline)>ncolumns:
+                    ncolumns=len(splitline)
+                if len(splitline)<ncolumns:
+                    break
+
+                dates.append(t0+dt.timedelta(float(splitline[0])-1))
+                rows.append(splitline[offset:offset+len(varlist)])
+            dates=np.array(dates,dtype='datetime64[s]')
+            values=np.array(rows,dtype=float).reshape(len(rows),len(varlist))
+
+        # values are a single (dates x variables) array; each variable gets a view of its column
+        for i,var in enumerate(varlist):
+            columns[var]=(dates,values[:,i])
+
+    zfile.close()
+    return GCM,scenario,timeper,columns,uzf_gages
+
+
+def _read_run_star(args):
+    return read_run(*args)
+
+
+def aggregate_all(varlist,results_folder,mode,processes=1):
+    # single-pass alternative to calling aggregate() once for each var:
+    # each zip file in results_folder is opened and parsed only once, for all of the variables in varlist
+    # varlist: list of all vars being aggregated for specified mode
+    # results_folder: master folder of zipped results
+    # mode: 'statvar','csvs','ggo','ssf'
+    # processes: number of worker processes for reading the zip files (1 reads them serially)
+    # returns GCMs, runs (list of read_run() results, one for each zip file)
+
+    print('reading all %s variables from each run...' %(mode))
+    allfiles=os.listdir(results_folder)
+    zipfiles=[f for f in allfiles if f.endswith('.zip')]
+    paths=[os.path.join(results_folder,z) for z in zipfiles]
+    paths=[path for path in paths if os.path.getsize(path)>0]
+
+    if processes>1:
+        # each worker parses whole zip files and returns arrays for its runs;
+        # runs are returned in the same order as the zip files
+        print('using %s processes' %(processes))
+        pool=multiprocessing.Pool(processes)
+        try:
+            runs=pool.map(_read_run_star,[(path,varlist,mode) for path in paths],chunksize=1)
+        finally: # shut down the workers even if a run can't be read
+            pool.terminate()
+            pool.join()
+    else:
+        runs=[]
+        for path in paths:
+            print(os.path.split(path)[1])
+            runs.append(read_run(path,varlist,mode))
+
+    GCMs=[]
+    for run in runs:
+        if run[0] not in GCMs:
+            GCMs.append(run[0])
+    return GCMs,runs
+
+
+def collect_var(var,runs,GCMs,spinup,**kwargs):
+    # reorganizes the values for one variable from the output of aggregate_all()
+    # into the same arrays returned by aggregate() (see build_var_values())
+    # returns overall_max,overall_min,var_values,uzf_gage
+
+    try:
+        separate=kwargs['separate']
+    except KeyError:
+        separate=False
+
+    var_runs=[]
+    uzf_gage=False
+    for GCM,scenario,timeper,columns,uzf_gages in runs:
+        uzf_gage=uzf_gage or uzf_gages[var]
+        dates,values=columns[var]
+        var_runs.append((GCM,scenario,timeper,dates,values))
+    overall_max,overall_min,var_values=build_var_values(var_runs,GCMs,spinup,separate=separate)
+    return(overall_max,overall_min,var_values,uzf_gage)
+
+
+def save_all_aggregated(varlist,aggregated_results_folder,GCMs,runs,spinup,**kwargs):
+    # writes the same csv files as save_aggregated(), for all variables in varlist,
+    # from the output of aggregate_all()
+    # returns the number of variables with no data (which are not written)
+
+    try:
+        separate=kwargs['separate']
+    except KeyError:
+        separate=False
+
+    no_data=0
+    for var in varlist:
+        print(var)
+        overall_max,overall_min,var_values,uzf_gage=collect_var(var,runs,GCMs,spinup,separate=separate)
+
+        # Test for all zeros (no data); if true skip to next var
+        if overall_max==0 and overall_min==0:
+            no_data+=1
+            print(' no data')
+            continue
+
+        save_aggregated(var,aggregated_results_folder,GCMs,var_values,uzf_gage,separate=separate)
+    return no_data
+
+
 def get_var_files(var, aggregated_results_folder, **kwargs):
     
     try:
@@ -333,9 +643,18 @@ def modeselektor(mode):
         stats=['mean_annual']
     return(stats)
 
+def _aggregated_items(csvs):
+    # returns a list of (name, DataFrame) for each scenario in csvs, which can be
+    # a list of csv files written by save_aggregated ('<var>.<scenario>[.<timeper>].csv'), or
+    # a dict of DataFrames (or csv files) by '<scenario>[.<timeper>]' name, as returned by aggregated_dataframes()
+    # names are in the '<scenario>[.<timeper>]' form either way
+    if isinstance(csvs,dict):
+        return [(name,read_aggregated(csv)) for name,csv in csvs.items()]
+    return [('.'.join(os.path.split(csv)[1].split('.')[1:-1]),read_aggregated(csv)) for csv in csvs]
+
 def plot_moving_avg_minmax(csvs,cols,timeunits,window,function,title,ylabel,colors,spinup,Synthetic_timepers):
     
-    # csvs= list of csv files with multi-column timeseries
+    # csvs= list of csv files with multi-column timeseries (or dict of DataFrames from aggregated_dataframes())
     # cols= list of column names to include in plot
     # timeunits= Pandas time units (e.g. 'D' for days)
     # window= width of moving avg window in timeunits
@@ -348,9 +667,8 @@ def plot_moving_avg_minmax(csvs,cols,timeunits,window,function,title,ylabel,colo
     hatches=["","|","-",""]
     transp=[.3,.3,.3,.3]
 
-    for i in range(len(csvs)):
-        # load csvs into Pandas dataframes; reduce to columns of interest
-        df=pd.read_csv(csvs[i], index_col='Date', parse_dates=True)
+    for i,(name,df) in enumerate(_aggregated_items(csvs)):
+        # reduce to columns of interest
         try:
             df=df[cols]
         except KeyError:
@@ -367,7 +685,7 @@ def plot_moving_avg_minmax(csvs,cols,timeunits,window,function,title,ylabel,colo
         smoothed=pd.rolling_window(df_rs,window,function,center='true')
            
         # plot out mean, max and min
-        scenario = os.path.split(csvs[i])[1].split('.')[1]
+        scenario = name.split('.')[0]
         
         try:
             ax=smoothed.mean(axis=1).plot(color=colors[i],label=scenario)
@@ -404,7 +722,7 @@ def plot_moving_avg_minmax(csvs,cols,timeunits,window,function,title,ylabel,colo
 
 def plot_q_minmax(csvs,cols,stat,title,ylabel,colors,spinup,scenarios,Synthetic_timepers):
     
-    # csvs= list of csv files with multi-column timeseries
+    # csvs= list of csv files with multi-column timeseries (or dict of DataFrames from aggregated_dataframes())
     # cols= list of column names to include in plot
     # stat= 'Mean Monthly', 'Mean Annual', 'Q10', 'Q90' 
     # title= plot title, ylabel= y-axis label
@@ -415,9 +733,8 @@ def plot_q_minmax(csvs,cols,stat,title,ylabel,colors,spinup,scenarios,Synthetic_
     hatches=["","|","-",""]
     transp=[.3,.3,.3,.3]
         
-    for i in range(len(csvs)):
-        # load csvs into Pandas dataframes; reduce to columns of interest
-        df=pd.read_csv(csvs[i], index_col='Date', parse_dates=True)
+    for i,(name,df) in enumerate(_aggregated_items(csvs)):
+        # reduce to columns of interest
         try:
             df=df[cols]
         except KeyError: # in case not all of the scenarios are present
@@ -454,7 +771,7 @@ def plot_q_minmax(csvs,cols,stat,title,ylabel,colors,spinup,scenarios,Synthetic_
             an[dstart:dend]=None
             
         # plot out mean, max and min
-        scenario=[sc for sc in scenarios if sc in csvs[i]][0]
+        scenario=[sc for sc in scenarios if sc in name][0]
         ax=an.mean(axis=1).plot(color=colors[i],label=scenario)
         ax.fill_between(an.index,an.max(axis=1),an.min(axis=1),alpha=transp[i],color=colors[i],edgecolor='k',linewidth=0.25)   
             
@@ -490,7 +807,7 @@ def calc_boxstats(csvs, dates, ranges, baseline_dates, stat):
     # Each column consists of values produced by each GCM-scenario combination
     
     # Inputs:
-    # csvs: list of csv files, one for each scenario
+    # csvs: list of csv files, one for each scenario (or dict of DataFrames from aggregated_dataframes())
     # dates= list of dates compare (box for each date)
     # ranges= number of years to include in each box, centered around date
     # e.g. date: 2030, range: 10 = 2025-2035
@@ -500,6 +817,9 @@ def calc_boxstats(csvs, dates, ranges, baseline_dates, stat):
     # initialize dict to store monthly groups, for each time period 
     groupsbyperiod=defaultdict(lambda: defaultdict(list))
     
+    # read each scenario once, for all of the time periods
+    items=_aggregated_items(csvs)
+    
     for d in range(len(dates)):
         
         # set time period limits
@@ -508,8 +828,8 @@ def calc_boxstats(csvs, dates, ranges, baseline_dates, stat):
         
         df=defaultdict()
         # build dict of Pandas dataframes, one for each csv.
-        for i in range(len(csvs)):
-            df[i]=pd.read_csv(csvs[i], index_col='Date', parse_dates=True)
+        for i,(name,frame) in enumerate(items):
+            df[i]=frame.copy()
             
             # check that tstart isn't within the specified model spinup period
             '''t0=df[i].index[0]
@@ -519,7 +839,7 @@ def calc_boxstats(csvs, dates, ranges, baseline_dates, stat):
                 print "Warning! Time period overlaps model spinup period, adjusting period start to end of spinup..."'''
             
             # Rename columns so they're unique.
-            scenario=csvs[i].split('.')[-2]
+            scenario=name.split('.')[-1]
             new_cols=[]
             for col_name in list(df[i].columns):
                 new_cols.append('%s_%s' %(scenario,col_name))
@@ -577,12 +897,11 @@ def calc_boxstats(csvs, dates, ranges, baseline_dates, stat):
     bstart=np.datetime64('%s-01-01' %(int(baseline_dates[0])))
     bstop=np.datetime64('%s-01-01' %(int(baseline_dates[1])))
     try:
-        csv=[f for f in csvs if '20c3m' in f][0]
+        df=[frame for name,frame in items if '20c3m' in name][0]
     except IndexError: # no file labeled '20c3m'- 20th cent probably included in continuous run
         # get 20th century data from one of the scenarios
-        csv=csvs[0]
+        df=items[0][1]
 
-    df=pd.read_csv(csv, index_col='Date', parse_dates=True)
     dfm=df.mean(axis=1)[bstart:bstop] # mean across all GCMS for each date
 
     if stat=='mean_annual':
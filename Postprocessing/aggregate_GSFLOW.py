@@ -10,53 +10,68 @@ import GSFLOW_utils
 results_folder='results'
 #mode='all' # 'stavar' 'csv' 'ggo' 'ssf' or 'uzf'
 spinup=0 # number of years to trim from beginning of each dataset
+processes=1 # number of worker processes for reading zip files in parallel (single-pass mode only)
 
-try:
-    mode=sys.argv[1] # 'statvar' 'csv' 'ggo' 'ssf' or 'uzf'
-except IndexError:
-    print '\naggregate+GSFLOW is called by entering:\n python aggregate+GSFLOW.py mode\n\nmode options: statvar, csv, ggo, ssf, uzf or all\n\nTo output each timeperiod to a separate csv, enter "separate" after the mode argument.\nOtherwise, time periods will be combined (one csv per variable-scenario).\n'
-    quit()
+# guard needed for the multiprocessing pool on Windows
+if __name__=='__main__':
+    try:
+        mode=sys.argv[1] # 'statvar' 'csv' 'ggo' 'ssf' or 'uzf'
+    except IndexError:
+        print '\naggregate+GSFLOW is called by entering:\n python aggregate+GSFLOW.py mode\n\nmode options: statvar, csv, ggo, ssf, uzf or all\n\nTo output each timeperiod to a separate csv, enter "separate" after the mode argument.\nOtherwise, time periods will be combined (one csv per variable-scenario).\n\nTo read the zip files separately for each variable (uses less memory), enter "pervar".\n'
+        quit()
  
-if 'separate' in sys.argv:
-    separate_flag=True
-else:
-    separate_flag=False
+    if 'separate' in sys.argv:
+        separate_flag=True
+    else:
+        separate_flag=False
 
+    # by default, each zip file is read once for all variables;
+    # enter "pervar" to read the zip files separately for each variable (old behavior; uses less memory)
+    if 'pervar' in sys.argv:
+        single_pass=False
+    else:
+        single_pass=True
 
-if mode=='all':
-    print "Aggregating everything..."
-    modes=['statvar', 'csv', 'ggo', 'ssf', 'uzf']
-else:
-    modes=[mode]
 
-for m in modes:
-    
-    # check to see if output directory exists, if not, make one:
-    if separate_flag:
-        GSFLOW_utils.check4output_folder(m+'_separated')
-        aggregated_results_folder=m+'_separated'
+    if mode=='all':
+        print "Aggregating everything..."
+        modes=['statvar', 'csv', 'ggo', 'ssf', 'uzf']
     else:
-        GSFLOW_utils.check4output_folder(m)
-        aggregated_results_folder=m
+        modes=[mode]
+
+    for m in modes:
+    
+        # check to see if output directory exists, if not, make one:
+        if separate_flag:
+            GSFLOW_utils.check4output_folder(m+'_separated')
+            aggregated_results_folder=m+'_separated'
+        else:
+            GSFLOW_utils.check4output_folder(m)
+            aggregated_results_folder=m
     
-    print "getting list of variables..."
-    varlist=GSFLOW_utils.getvars(results_folder,m)
+        print "getting list of variables..."
+        varlist=GSFLOW_utils.getvars(results_folder,m)
     
-    print '\nAggregating %s variables from all runs...' %(m)
-    no_data=0
-    for var in varlist:
+        print '\nAggregating %s variables from all runs...' %(m)
+        if single_pass:
+            # read each zip file once for all variables, then write the csvs for each variable
+            GCMs,runs=GSFLOW_utils.aggregate_all(varlist,results_folder,m,processes=processes)
+            no_data=GSFLOW_utils.save_all_aggregated(varlist,aggregated_results_folder,GCMs,runs,spinup,separate=separate_flag)
+        else:
+            no_data=0
+            for var in varlist:
         
-        overall_max,overall_min,GCMs,var_values,uzf_gage=GSFLOW_utils.aggregate(var,varlist,results_folder,m,spinup,separate=separate_flag)
+                overall_max,overall_min,GCMs,var_values,uzf_gage=GSFLOW_utils.aggregate(var,varlist,results_folder,m,spinup,separate=separate_flag)
     
-        # Test for all zeros (no data); if true skip to next var
-        if overall_max==0 and overall_min==0:
-            no_data+=1
-            print " no data"
-            continue
+                # Test for all zeros (no data); if true skip to next var
+                if overall_max==0 and overall_min==0:
+                    no_data+=1
+                    print " no data"
+                    continue
         
-        GSFLOW_utils.save_aggregated(var,aggregated_results_folder,GCMs,var_values,uzf_gage,separate=separate_flag)
+                GSFLOW_utils.save_aggregated(var,aggregated_results_folder,GCMs,var_values,uzf_gage,separate=separate_flag)
       
-    print "%s %s had no data" %(no_data,m)
-print "Done!"
+        print "%s %s had no data" %(no_data,m)
+    print "Done!"
 
     
\ No newline at end of file
@@ -3,6 +3,7 @@ __author__ = 'aleaf'
 program for aggregating results from numerous runs into csv files by variable
 '''
 import os
+import numpy as np
 import pandas as pd
 import sys
 sys.path.append('..')
@@ -17,57 +18,69 @@ if not os.path.isdir(output_folder):
 statvarfiles = sorted([os.path.join(PRMSresults_folder, f) for f in os.listdir(PRMSresults_folder)
                        if 'statvar' in f and f.endswith('.dat')])
 
-# read all statvar files into one giant dataframe
 scenarios = list(set([f.split('.')[1] for f in statvarfiles if '20c3m' not in f]))
-df_all = pd.DataFrame()
+
+# first pass: read only the dates (and the variable names) from each statvar file
+runs = []
+run_dates = []
+variables = []
 for f in statvarfiles:
 
     # instantiate statvar file object
     sv = statvarFile(f)
 
-    # read contents of statvar file to pandas dataframe
-    df = sv.read2df()
-
-    # assign a run identifier to dataframe columns
-    # append 20th century runs for each scenario (makes for a larger dataframe, but simplifies pivoting)
+    run_dates.append(np.concatenate([index.values for index, values in sv.iter_chunks(usecols=[])]))
+    runs.append(sv)
+    variables += [c for c in sv.statnames[1:] if c not in variables]
+
+# put all of the runs into one array (dates x runs x variables)
+dates = np.unique(np.concatenate(run_dates))
+data = np.empty((len(dates), len(runs), len(variables)))
+data.fill(np.nan)
+
+# second pass: fill in the values from each statvar file, one block of lines at a time
+for i, sv in enumerate(runs):
+    cols = [variables.index(v) for v in sv.statnames[1:]]
+    for index, values in sv.iter_chunks():
+        rows = np.searchsorted(dates, index.values)
+        data[rows[:, np.newaxis], i, cols] = values
+
+# assign a run identifier to each column of the output
+# 20th century runs are included in the columns for each scenario (by index, without copying the data)
+column_runs = {}
+for i, sv in enumerate(runs):
     if '20c3m' in sv.run:
         for s in scenarios:
-            s20th = sv.run.replace('20c3m', s)
-            df['run'] = s20th
-
-            # add to master dataframe
-            df_all = df_all.append(df)
+            column_runs.setdefault(sv.run.replace('20c3m', s), []).append(i)
     else:
-        df['run'] = sv.run
-        df_all = df_all.append(df)
+        column_runs.setdefault(sv.run, []).append(i)
+columns = sorted(column_runs.keys())
 
 # for each variable...
-print '\npivoting to variables and saving...'
-variables = [c for c in df_all.columns if c != 'run']
-
-for var in variables:
+print '\nsaving variables...'
+index = pd.DatetimeIndex(dates, name='Date')
+for v, var in enumerate(variables):
     print var,
-    # select data for variable
-    df_all['Date'] = df_all.index
-    dfv = df_all[['Date', var, 'run']]
-
-    # pivoted dataframe of single variable, with one column for each gcm-scenario-realization
-    dfv = dfv.pivot(index='Date', columns='run', values=var)
 
-    # save out a csv for each scenario in dfv
+    # save out a csv for each scenario
     for s in scenarios:
 
-        # select only the dataframe columns for the scenario
-        scen_columns = [c for c in dfv.columns if s in c]
-        dfvs = dfv[scen_columns]
+        # select only the columns for the scenario
+        scen_columns = [c for c in columns if s in c]
+
+        # combine the runs (e.g. 20th century and future) for each column
+        values = np.empty((len(dates), len(scen_columns)))
+        values.fill(np.nan)
+        for j, c in enumerate(scen_columns):
+            for i in column_runs[c]:
+                fill = np.isnan(values[:, j])
+                values[fill, j] = data[fill, i, v]
 
         # remove scenario info from columns (already in filename)
-        dfvs.columns = [c.replace('{}.'.format(s), '') for c in dfvs.columns]
+        dfvs = pd.DataFrame(values, index=index,
+                            columns=[c.replace('{}.'.format(s), '') for c in scen_columns])
 
         outcsv = os.path.join(output_folder, '{}.{}.csv'.format(var, s))
         dfvs.to_csv(outcsv, index_label='Date')
 
 print '\n\nDone'
-
-
-
@@ -6,13 +6,24 @@ import pandas as pd
 import calendar
 
 
+def read_aggregated(csv):
+    '''
+    Returns a DataFrame of aggregated results for a scenario, indexed by date, with a column for each GCM.
+    csv can be the name of a csv file written by GSFLOW_utils.save_aggregated,
+    or a DataFrame already in the same format (e.g., from GSFLOW_utils.aggregated_dataframes)
+    '''
+    if isinstance(csv, pd.DataFrame):
+        return csv.copy()
+    return pd.read_csv(csv, index_col='Date', parse_dates=True)
+
+
 def moving_avg_from_csvs(csvs, gcms, window, spinup, function='boxcar', time_units='D'):
 
     dfs = {}
 
     for csv in csvs.keys():
         # load csvs into Pandas dataframes; reduce to columns of interest
-        df = pd.read_csv(csvs[csv], index_col='Date', parse_dates=True)
+        df = read_aggregated(csvs[csv])
 
         try:
             df = df[gcms]
@@ -47,7 +58,7 @@ def annual_timeseries(csvs, gcms, spinup, stat, calc='mean', quantile=None):
 
     for csv in csvs.keys():
         # load csvs into Pandas dataframes; reduce to columns of interest
-        df = pd.read_csv(csvs[csv], index_col='Date', parse_dates=True)
+        df = read_aggregated(csvs[csv])
 
         try:
             df = df[gcms]
@@ -98,6 +109,7 @@ def period_stats(csvs, compare_periods, stat, baseline_period=np.array([]),
 
     Inputs:
     csvs: dictionary {scenario name: filename} of csv files, one for each climate scenario
+    (DataFrames in the same format as the csv files can be supplied instead of filenames)
 
     compare_periods: np array of [tstart, tend] for each time period (box)
 
@@ -118,7 +130,7 @@ def period_stats(csvs, compare_periods, stat, baseline_period=np.array([]),
 
     # build list of Pandas dataframes, one for each csv.
     for csv in csvs.keys():
-        df = pd.read_csv(csvs[csv], index_col='Date', parse_dates=True)
+        df = read_aggregated(csvs[csv])
 
         # Rename columns so they're unique.
         df.columns = ['{}_{}'.format(csv, c) for c in df.columns]
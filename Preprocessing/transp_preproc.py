@@ -23,6 +23,7 @@ except:
 
 # inputs
 datadir = 'D:/ATLData/BlackEarth/input' # contains existing PRMS .data files
+cache_dir = None # folder for binary copies of the parsed .data files (faster re-reads); None for no cache
 
 # growing season parameters
 uniform = False # T/F; T: one growing season for entire domain (incomplete option), F: growing season by hru
@@ -114,35 +115,35 @@ def uniform_growing_season(df, data, frost_temp):
 
 def growing_season_by_hru(df, frost_temp):
     '''
-    find last date where tmin is < frost_temp
+    find last date before July 1st and first date after July 1st where tmin is <= frost_temp,
+    for each year and hru (as day numbers within the year, starting at 1)
+
+    years with no frost before July 1st get a last frost of 0;
+    years with no frost after July 1st get a first frost of the number of days in the year + 1
     '''
     print '\ndetermining growing season...'
-    # group tmin data by year
-    dfg = df.groupby(lambda x: x.year)
-
-    # initialize dataframes for last and first frosts by hru
-    years = [y for y, g in dfg]
-    df_lf = pd.DataFrame(index=years, columns=df.columns)
-    df_ff = pd.DataFrame(index=years, columns=df.columns)
-
-    # iterate through years and dataframes in dfg
-    for year, dfy in dfg:
-        print year,
-        # reindex dataframe to day of year
-        dfy.index = np.arange(len(dfy))+1
-
-        # split year in half on July 1st
-        dfy1, dfy2 = dfy.iloc[:182, :], dfy.iloc[182:, :]
-
-        # last frost is the last day before July 1st on which tmin <= frost_temp (returns single row vector)
-        # first frost is the first day after July 1st on which tmin <= frost_temp
-        last_frost = dfy1.apply(lambda x: x[x <= frost_temp].dropna().index[-1])
-        first_frost = dfy2.apply(lambda x: x[x <= frost_temp].dropna().index[0])
-
-        # assign (1 x nhru) vectors of last/first frosts to year in DataFrame
-        df_lf.loc[year, :] = last_frost
-        df_ff.loc[year, :] = first_frost
-    print '\n'
+    # put the tmin data into a (years x 366 days x nhru) array, with nans for days not in the year
+    years, starts, ndays = np.unique(df.index.year, return_index=True, return_counts=True)
+    day = np.arange(len(df)) - np.repeat(starts, ndays)
+    tmin = np.empty((len(years), 366, df.shape[1]))
+    tmin.fill(np.nan)
+    tmin[np.repeat(np.arange(len(years)), ndays), day, :] = df.values
+
+    # boolean array of frost days (nans compare as False)
+    with np.errstate(invalid='ignore'):
+        frost = tmin <= frost_temp
+
+    # split year in half on July 1st
+    frost1, frost2 = frost[:, :182, :], frost[:, 182:, :]
+
+    # last frost is the last day before July 1st on which tmin <= frost_temp (argmax of the reversed first half)
+    # first frost is the first day after July 1st on which tmin <= frost_temp
+    last_frost = np.where(frost1.any(axis=1), 182 - np.argmax(frost1[:, ::-1, :], axis=1), 0)
+    first_frost = np.where(frost2.any(axis=1), 183 + np.argmax(frost2, axis=1), ndays[:, np.newaxis] + 1)
+
+    # (n years x n hrus) DataFrames of last/first frosts
+    df_lf = pd.DataFrame(last_frost, index=years, columns=df.columns)
+    df_ff = pd.DataFrame(first_frost, index=years, columns=df.columns)
     return df_lf, df_ff
 
 
@@ -153,9 +154,10 @@ def growing_season_by_hru(df, frost_temp):
 # dict of dataframes, one per future emissions scenario
 gsl = dict(zip(scenarios, [pd.DataFrame()] * len(scenarios)))
 
+cache = PRMSio.binaryCache(cache_dir) if cache_dir is not None else None
 for f in datafiles:
 
-    data = PRMSio.datafile(f)
+    data = PRMSio.datafile(f, cache=cache)
 
     df = data.read2df()
 
@@ -0,0 +1,188 @@
+import sys
+sys.path.append('..')
+import io
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import PRMSio
+
+
+def write_lines(dates, values, **kwargs):
+    """Writes dates and values with PRMSio.write_prms_text; returns the lines written"""
+    ofp = io.BytesIO()
+    PRMSio.write_prms_text(ofp, dates, values, **kwargs)
+    return ofp.getvalue().decode().splitlines()
+
+
+def expected_lines(dates, values, precision):
+    """Same lines written value by value with '%.*f' formatting"""
+    return ['{} {} {} 0 0 0 '.format(d.year, d.month, d.day) +
+            ' '.join('%.*f' % (p, v) for p, v in zip(precision, row))
+            for d, row in zip(dates, values)]
+
+
+def test_write_prms_text():
+    """Test that the bulk PRMS text writer matches '%.Nf' formatting"""
+
+    # exact ties (0.125, 0.375, 2.5...), values just off ties (2.675, 1.005), negatives and -0.00
+    values = np.array([[0.125, 0.375, 2.675, 1.005, 0.5, 1.5, 2.5, -0.001, -0.0, -12.345, 1e6 + 0.005, 0.]])
+    rng = np.random.RandomState(0)
+    values = np.vstack([values, np.round(rng.normal(0, 30, (500, values.shape[1])), 3),
+                        rng.normal(0, 30, (500, values.shape[1]))])
+    dates = pd.date_range('2000-01-01', periods=len(values))
+    for p in [0, 2, 3]:
+        assert write_lines(dates, values, precision=p) == expected_lines(dates, values, [p] * values.shape[1])
+
+    # per-column precision
+    precision = [0, 1, 2, 3, 4, 5] * 2
+    assert write_lines(dates, values, precision=precision) == expected_lines(dates, values, precision)
+
+    # results don't depend on where the chunk boundaries are
+    for chunksize in [1, 7, 499, 10000]:
+        assert write_lines(dates, values, chunksize=chunksize) == write_lines(dates, values)
+
+    # nans are written as na_value
+    lines = write_lines(dates[:2], np.array([[1.234, np.nan], [np.nan, 5.]]), na_value=-999)
+    assert lines == ['2000 1 1 0 0 0 1.23 -999.00', '2000 1 2 0 0 0 -999.00 5.00']
+
+    # integer arrays (e.g. transp_on) are written as integers
+    transp_on = np.array([[0, 1, 1], [1, 1, 0]], dtype=np.int8)
+    assert write_lines(dates[:2], transp_on) == ['2000 1 1 0 0 0 0 1 1', '2000 1 2 0 0 0 1 1 0']
+
+    # values too large to scale to exact integers, and infinite values
+    large = np.array([[1e15, -1e20, 3.], [np.inf, -np.inf, 2.]])
+    assert write_lines(dates[:2], large, precision=5) == expected_lines(dates[:2], large, [5] * 3)
+
+
+def cache_size(cache):
+    """Total size of the files in the cache folder"""
+    return sum([os.path.getsize(os.path.join(cache.cache_dir, f)) for f in os.listdir(cache.cache_dir)])
+
+
+def test_binary_cache():
+    """Test binaryCache hits, invalidation of changed files, and eviction of the least recently used entries"""
+    if os.path.isdir('test_cache'):
+        shutil.rmtree('test_cache')
+    os.mkdir('test_cache')
+    cache = PRMSio.binaryCache('test_cache/npy')
+    dates = pd.date_range('2000-01-01', periods=100)
+    values = np.arange(300.).reshape(100, 3)
+
+    # text files to cache the values for
+    files = ['test_cache/{}.data'.format(name) for name in ['a', 'b', 'c']]
+    for f in files:
+        with open(f, 'w') as dest:
+            dest.write('values for {}\n'.format(f))
+
+    # hits return the saved dates, and the values as a read-only memmap
+    f = files[0]
+    assert cache.load(f) is None
+    cache.save(f, dates, values)
+    cached_dates, cached_values = cache.load(f)
+    assert cached_dates.equals(dates)
+    assert np.array_equal(cached_values, values)
+    assert isinstance(cached_values, np.memmap) and not cached_values.flags.writeable
+    del cached_values
+    assert cache.load(f, dtype=np.float32) is None # entries are separate for each dtype
+
+    # a change in modification time invalidates the entry; the old entry is removed
+    stat = os.stat(f)
+    os.utime(f, (stat.st_atime, stat.st_mtime + 10))
+    assert cache.load(f) is None
+    assert len(os.listdir(cache.cache_dir)) == 0
+
+    # so does a change in size (with the same modification time)
+    cache.save(f, dates, values)
+    stat = os.stat(f)
+    with open(f, 'a') as dest:
+        dest.write('more values\n')
+    os.utime(f, (stat.st_atime, stat.st_mtime))
+    assert cache.load(f) is None
+    assert len(os.listdir(cache.cache_dir)) == 0
+
+    # invalidate removes the entries for one file; clear removes everything
+    for f in files[:2]:
+        cache.save(f, dates, values)
+    cache.invalidate(files[0])
+    assert cache.load(files[0]) is None
+    assert cache.load(files[1]) is not None
+    cache.save(files[0], dates, values)
+    cache.clear()
+    assert len(os.listdir(cache.cache_dir)) == 0
+
+    # with room for two entries, saving a third evicts the least recently used
+    cache.save(files[0], dates, values)
+    entry_size = cache_size(cache)
+    cache.save(files[1], dates, values)
+    cache.max_size_mb = 2.5 * entry_size / 1e6
+    now = os.stat(files[0]).st_mtime
+    for key, cachefiles in cache._entries().items():
+        age = 100 if key.startswith(cache._path_key(files[0])) else 50
+        for cachefile in cachefiles:
+            os.utime(cachefile, (now - age, now - age))
+    cache.load(files[0]) # files[0] was saved first, but used last
+    cache.save(files[2], dates, values)
+    assert cache.load(files[1]) is None
+    assert cache.load(files[0]) is not None
+    assert cache.load(files[2]) is not None
+    assert cache_size(cache) == 2 * entry_size
+
+    # evict with a smaller size removes entries down to that size
+    cache.evict(max_size_mb=1.5 * entry_size / 1e6)
+    assert cache_size(cache) == entry_size
+    shutil.rmtree('test_cache')
+
+
+def write_ncfile(ncfile, values, format, chunksizes=None):
+    """Writes values (times x y x x) to a netCDF file"""
+    import netCDF4
+    f = netCDF4.Dataset(ncfile, 'w', format=format)
+    for dim, size in zip(['time', 'y', 'x'], values.shape):
+        f.createDimension(dim, size)
+        f.createVariable(dim, 'f8', (dim,))[:] = np.arange(size)
+    kwargs = {} if chunksizes is None else {'chunksizes': chunksizes, 'zlib': True}
+    var = f.createVariable('tmax', 'f4', ('time', 'y', 'x'), fill_value=-9999., **kwargs)
+    var[:] = values
+    f.close()
+
+
+def test_read_ncfile():
+    """Test that _read_ncfile matches reading the values one timestep at a time,
+    for netCDF3 (unchunked) and chunked netCDF4 files"""
+    if os.path.isdir('test_nc'):
+        shutil.rmtree('test_nc')
+    os.mkdir('test_nc')
+    import netCDF4
+    rng = np.random.RandomState(0)
+    values = np.ma.masked_array(rng.normal(20, 5, (800, 9, 11)).astype(np.float32))
+    values[:, 4, 5] = np.ma.masked # missing values are returned as nans
+
+    # model bounding box (rows and columns; not necessarily contiguous), and the points within the extent
+    yinds = np.zeros(9, dtype=bool)
+    yinds[[2, 3, 4, 6]] = True
+    xinds = np.zeros(11, dtype=bool)
+    xinds[3:8] = True
+    within = rng.rand(np.sum(yinds) * np.sum(xinds)) > 0.3
+
+    for format, chunksizes in [('NETCDF3_CLASSIC', None), ('NETCDF3_64BIT_OFFSET', None),
+                               ('NETCDF4', None), ('NETCDF4', (100, 5, 5)), ('NETCDF4', (7, 9, 11))]:
+        ncfile = 'test_nc/{}.nc'.format(format)
+        write_ncfile(ncfile, values, format, chunksizes)
+
+        f = netCDF4.Dataset(ncfile)
+        var = f.variables['tmax']
+        expected = np.array([np.ma.filled(var[i, yinds, xinds], np.nan).ravel()[within] for i in range(len(values))])
+        f.close()
+
+        times, read = PRMSio._read_ncfile(ncfile, 'tmax', 'time', xinds, yinds, within)
+        assert np.array_equal(times, np.arange(len(values)))
+        assert np.array_equal(read, expected, equal_nan=True)
+        assert np.isnan(read).any()
+    shutil.rmtree('test_nc')
+
+
+if __name__ == '__main__':
+    test_write_prms_text()
+    test_binary_cache()
+    test_read_ncfile()
@@ -6,6 +6,7 @@ import glob
 import numpy as np
 import pandas as pd
 import zipfile as zf
+import GSFLOW_utils
 
 
 def get_info(zipfile_handle):
@@ -70,5 +71,56 @@ def test_aggregated_ggo():
             if not np.all(np.isnan(agg[gcm])):
                 assert (orig[2] - agg[gcm]).sum() < 1e-8
 
+def test_build_var_values():
+    """Test that runs are assembled into one (dates x GCMs) array per scenario,
+    with NaNs for missing values and spinup years excluded"""
+
+    dates = np.arange('2000-01-01', '2002-01-01', dtype='datetime64[D]').astype('datetime64[s]')
+    values = np.arange(len(dates), dtype=float)
+    var_runs = [('gcm1', 'sresa1b', '2000-2001', dates, values),
+                ('gcm2', 'sresa1b', '2000-2001', dates[:10], values[:10] + 0.5),
+                ('gcm2', '20c3m', '2000-2001', dates, -values)]
+    GCMs = ['gcm1', 'gcm2']
+
+    overall_max, overall_min, var_values = GSFLOW_utils.build_var_values(var_runs, GCMs, 0)
+    assert overall_max == values.max()
+    assert overall_min == -values.max()
+    dates_a1b, values_a1b = var_values['sresa1b']
+    assert np.array_equal(dates_a1b, dates)
+    assert values_a1b.shape == (len(dates), 2)
+    assert np.array_equal(values_a1b[:, 0], values)
+    assert np.array_equal(values_a1b[:10, 1], values[:10] + 0.5)
+    assert np.all(np.isnan(values_a1b[10:, 1]))
+    assert np.all(np.isnan(var_values['20c3m'][1][:, 0]))
+
+    # with a 1 year spinup, dates in 2000 are kept in the index but have no values
+    overall_max, overall_min, var_values = GSFLOW_utils.build_var_values(var_runs, GCMs, 1, separate=True)
+    dates_a1b, values_a1b = var_values['sresa1b']['2000-2001']
+    assert len(dates_a1b) == len(dates)
+    assert np.all(np.isnan(values_a1b[:366]))
+    assert np.array_equal(values_a1b[366:, 0], values[366:])
+
+    dfs = GSFLOW_utils.aggregated_dataframes(var_values, GCMs)
+    assert list(dfs.keys()) == ['sresa1b.2000-2001', '20c3m.2000-2001']
+    assert list(dfs['20c3m.2000-2001'].columns) == GCMs
+
+
+def test_read_columns():
+    """Test bulk parsing of statvar and csv lines, including truncated files"""
+
+    statvar = ['1 1961 1 1 0 0 0 0.1 2.5\n',
+               '2 1961 1 2 0 0 0 0.30000000000000004 -1e-05\n',
+               '3 1961 1 3 0 0 0 0.2\n', # incomplete line from a failed run
+               '4 1961 1 4 0 0 0 0.2 1.0\n']
+    dates, values = GSFLOW_utils.read_columns(statvar, 'statvar', 7, 2)
+    assert list(dates.astype(str)) == ['1961-01-01T00:00:00', '1961-01-02T00:00:00']
+    assert values.tolist() == [[0.1, 2.5], [0.30000000000000004, -1e-05]]
+
+    csv = ['12/31/1999,1.5,2\n', '1/1/2000,3.25,4\n']
+    dates, values = GSFLOW_utils.read_columns(csv, 'csv', 2, 1)
+    assert list(dates.astype(str)) == ['1999-12-31T00:00:00', '2000-01-01T00:00:00']
+    assert values.tolist() == [[2.0], [4.0]]
+
+
 if __name__ == '__main__':
     test_aggregated_ggo()
\ No newline at end of file
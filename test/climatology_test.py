@@ -0,0 +1,75 @@
+import sys
+sys.path.append('..')
+sys.path.append('../BEC_fill_in_climate')
+import numpy as np
+import pandas as pd
+import climatology
+
+
+def test_daily_stats():
+    """Test that the daily means and standard deviations match groupby (month, day) statistics"""
+    dates = pd.date_range('1999-01-01', '2004-12-31')
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(rng.normal(10, 5, (len(dates), 3)), index=dates, columns=['a', 'b', 'c'])
+
+    # missing values, a station with only one value on a day (2/29 is in two of the years),
+    # and a day with no values for a station
+    df.iloc[rng.randint(0, len(dates), 300), 0] = np.nan
+    df.loc[df.index == '2000-02-29', 'b'] = np.nan
+    df.loc[(df.index.month == 7) & (df.index.day == 4), 'c'] = np.nan
+
+    groups = df.groupby([df.index.month, df.index.day])
+    means, stds = climatology.daily_stats(df)
+    assert np.allclose(means.values, groups.mean().values, equal_nan=True)
+    assert np.allclose(stds.values, groups.std().values, equal_nan=True)
+    assert list(means.index) == list(groups.mean().index)
+    assert np.isnan(stds.loc[(2, 29), 'b']) and not np.isnan(means.loc[(2, 29), 'b'])
+    assert np.isnan(means.loc[(7, 4), 'c'])
+    assert climatology.daily_stats(df, std=False).equals(means)
+
+
+def test_smooth():
+    """Test that smooth matches a centered rolling mean, wrapped around the end of the year"""
+    rng = np.random.RandomState(1)
+    index = pd.MultiIndex.from_arrays([pd.date_range('2000-01-01', '2000-12-31').month,
+                                       pd.date_range('2000-01-01', '2000-12-31').day])
+    stats = pd.DataFrame(rng.normal(0, 1, (len(index), 2)), index=index)
+
+    for window in [1, 2, 7, 30, 31]:
+        # rolling mean of three copies of the year; the middle copy is wrapped at both ends
+        wrapped = pd.concat([stats] * 3, ignore_index=True)
+        expected = wrapped.rolling(window, center=True).mean().values[len(stats):2 * len(stats)]
+        assert np.allclose(climatology.smooth(stats, window).values, expected)
+
+    # only the days with a nan in their window are nan
+    stats.loc[(2, 29), 0] = np.nan
+    wrapped = pd.concat([stats] * 3, ignore_index=True)
+    for window in [1, 30, 100]:
+        expected = wrapped.rolling(window, center=True).mean().values[len(stats):2 * len(stats)]
+        smoothed = climatology.smooth(stats, window).values
+        assert np.allclose(smoothed, expected, equal_nan=True)
+        assert np.sum(np.isnan(smoothed[:, 0])) == window
+        assert not np.isnan(smoothed[:, 1]).any()
+
+
+def test_expand():
+    """Test that expand looks up the statistics for each date, with nans for days that aren't in the statistics"""
+    dates = pd.date_range('2001-01-01', '2003-12-31')
+    df = pd.DataFrame(np.arange(2. * len(dates)).reshape(len(dates), 2), index=dates)
+    means = climatology.daily_stats(df, std=False)
+    assert (2, 29) not in means.index
+
+    leapdates = pd.date_range('2003-12-30', '2004-03-01')
+    expanded = climatology.expand(means, leapdates)
+    assert list(climatology.day_rows(means, leapdates[[0, 61]])) == [363, -1]
+    for date, row in expanded.iterrows():
+        if date.month == 2 and date.day == 29:
+            assert row.isnull().all()
+        else:
+            assert np.array_equal(row.values, means.loc[(date.month, date.day)].values)
+
+
+if __name__ == '__main__':
+    test_daily_stats()
+    test_smooth()
+    test_expand()